@@ -0,0 +1,241 @@
+"""
+Content-addressed store for generated images (Gemini try-on results).
+
+Files are named by the SHA-256 of their bytes and sharded two levels deep
+(ab/cd/abcd....jpg), so identical results are stored once and a URL never
+changes meaning, which makes it safe to serve with immutable cache headers.
+Each asset has a row in generated_assets (owner, product, pet, size, last
+access); when total size exceeds the quota the least recently used assets
+are evicted.
+
+Storage is behind a small backend interface: LocalDiskBackend today, an
+object store backend can implement the same four methods.
+"""
+import os
+import time
+import hashlib
+import tempfile
+import threading
+
+
+GENERATED_ASSET_DIR = os.environ.get('GENERATED_ASSET_DIR', 'generated')
+GENERATED_ASSET_QUOTA_MB = float(os.environ.get('GENERATED_ASSET_QUOTA_MB', '2048'))
+GENERATED_ASSET_URL_PREFIX = '/generated/'
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Don't write last_accessed_at more often than this per asset and process
+TOUCH_INTERVAL_SECONDS = 3600
+
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+}
+
+
+# =======================
+# Storage backends
+# =======================
+class StorageBackend:
+    """Where asset bytes live"""
+
+    def put(self, key, data, content_type):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def url(self, key):
+        """Public URL for a stored key"""
+        raise NotImplementedError
+
+
+class LocalDiskBackend(StorageBackend):
+    """Files under a local directory, served by the app's /generated/ route"""
+
+    def __init__(self, root=GENERATED_ASSET_DIR):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, key, data, content_type):
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write-then-rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def url(self, key):
+        return GENERATED_ASSET_URL_PREFIX + key
+
+
+BACKENDS = {
+    'local': LocalDiskBackend,
+}
+
+
+# =======================
+# Asset store
+# =======================
+def storage_key(content_hash, content_type):
+    ext = EXTENSIONS.get(content_type, '.bin')
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext}"
+
+
+class AssetStore:
+    """Generated-asset store with metadata index and LRU quota"""
+
+    def __init__(self, backend, get_conn, quota_bytes=int(GENERATED_ASSET_QUOTA_MB * 1024 * 1024)):
+        self.backend = backend
+        self.get_conn = get_conn
+        self.quota_bytes = quota_bytes
+        self._touched = {}
+        self._touch_lock = threading.Lock()
+
+    def put(self, data, content_type='image/jpeg', owner_user_id=None, product_id=None,
+            pet_id=None, cache_key=None):
+        """Store bytes (deduplicated by content) and return their public URL"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        key = storage_key(content_hash, content_type)
+        self.backend.put(key, data, content_type)
+
+        conn = self.get_conn()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO generated_assets
+                    (content_hash, storage_key, content_type, size_bytes,
+                     owner_user_id, product_id, pet_id, cache_key)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (content_hash) DO UPDATE
+                SET last_accessed_at = now(),
+                    cache_key = COALESCE(EXCLUDED.cache_key, generated_assets.cache_key)
+            """, (content_hash, key, content_type, len(data),
+                  owner_user_id, product_id, pet_id, cache_key))
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+        self.enforce_quota()
+        return self.backend.url(key)
+
+    def find(self, cache_key):
+        """URL of a previously stored asset with this cache key, or None"""
+        conn = self.get_conn()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT storage_key FROM generated_assets
+                WHERE cache_key = %s
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (cache_key,))
+            row = cur.fetchone()
+        finally:
+            cur.close()
+            conn.close()
+        if row and self.backend.exists(row[0]):
+            self.touch(row[0])
+            return self.backend.url(row[0])
+        return None
+
+    def touch(self, key):
+        """Record an access for LRU (throttled per process)"""
+        now = time.monotonic()
+        with self._touch_lock:
+            if now - self._touched.get(key, -TOUCH_INTERVAL_SECONDS) < TOUCH_INTERVAL_SECONDS:
+                return
+            self._touched[key] = now
+            if len(self._touched) > 10000:
+                self._touched.clear()
+
+        conn = self.get_conn()
+        cur = conn.cursor()
+        try:
+            cur.execute("UPDATE generated_assets SET last_accessed_at = now() WHERE storage_key = %s", (key,))
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+    def enforce_quota(self, batch_size=100):
+        """Evict least recently used assets until total size fits the quota"""
+        conn = self.get_conn()
+        cur = conn.cursor()
+        evicted = 0
+        try:
+            cur.execute("SELECT COALESCE(sum(size_bytes), 0) FROM generated_assets")
+            usage = cur.fetchone()[0]
+            while usage > self.quota_bytes:
+                cur.execute("""
+                    SELECT content_hash, size_bytes FROM generated_assets
+                    ORDER BY last_accessed_at
+                    LIMIT %s
+                """, (batch_size,))
+                victims = []
+                excess = usage - self.quota_bytes
+                for content_hash, size_bytes in cur.fetchall():
+                    victims.append(content_hash)
+                    excess -= size_bytes
+                    if excess <= 0:
+                        break
+                if not victims:
+                    break
+
+                cur.execute("""
+                    DELETE FROM generated_assets
+                    WHERE content_hash = ANY(%s)
+                    RETURNING storage_key, size_bytes
+                """, (victims,))
+                rows = cur.fetchall()
+                conn.commit()
+                # Index rows are gone (committed) before the files, so a
+                # concurrent find() never hands out a URL for a deleted file
+                for key, size_bytes in rows:
+                    self.backend.delete(key)
+                    usage -= size_bytes
+                    evicted += 1
+                if not rows:
+                    # Another process evicted the same rows; re-read usage
+                    cur.execute("SELECT COALESCE(sum(size_bytes), 0) FROM generated_assets")
+                    usage = cur.fetchone()[0]
+        finally:
+            cur.close()
+            conn.close()
+        if evicted:
+            print(f">>> Asset store evicted {evicted} assets (quota {self.quota_bytes} bytes)")
+        return evicted
+
+
+def create_backend(name=None):
+    name = name or os.environ.get('ASSET_STORE_BACKEND', 'local')
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown asset store backend: {name}")
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the external services, for load tests (no network,
+no API quota).
+
+    python bench/fake_services.py                                   # port 9100, fast and healthy
+    python bench/fake_services.py --gemini-latency 4 --gemini-jitter 2
+    python bench/fake_services.py --translator-error-rate 0.2 --naver-latency 0.3
+
+Point the app at it with:
+
+    GEMINI_BASE_URL=http://127.0.0.1:9100/gemini
+    GOOGLE_API_KEY=AIza-loadtest
+    NAVER_SHOP_API_URL=http://127.0.0.1:9100/naver/v1/search/shop.json
+    TRANSLATOR_BASE_URL=http://127.0.0.1:9100/translate
+
+Endpoints (each service with its own latency, jitter and error rate):
+  - POST /gemini/<version>/models/<model>:generateContent
+        a generated JPEG as inline image data, like the image model
+  - GET  /naver/v1/search/shop.json
+        ?display= items shaped like Naver Shopping results
+  - GET  /translate
+        Google Translate's mobile page: <div class="t0">...</div>
+  - GET  /images/<n>.jpg
+        product images referenced by the Naver items (Naver's latency)
+Failures answer 503 (429 for the translator, which is how it fails in
+practice). Per-service request/error counts are at GET /stats.
+"""
+import io
+import re
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from PIL import Image
+
+
+SERVICES = ('gemini', 'naver', 'translator')
+GEMINI_PATH = re.compile(r'^/gemini/[^/]+/models/[^/:]+:generateContent$')
+IMAGE_PATH = re.compile(r'^/images/(\d+)\.jpg$')
+
+NAVER_TITLES = (
+    '<b>강아지</b> 겨울 패딩', '<b>강아지</b> 레인코트', '반려견 니트 <b>옷</b>',
+    '<b>강아지</b> 하네스 세트', '소형견 원피스', '<b>강아지</b> 후드티',
+)
+NAVER_MALLS = ('PuppyMall', '멍멍스토어', 'PetHouse', '댕댕샵')
+
+
+def make_jpeg(seed, size=256):
+    """A small solid-colour JPEG, different per seed"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=80)
+    return out.getvalue()
+
+
+class Behaviour:
+    """Latency (mean + uniform jitter, seconds) and error rate of one fake service"""
+
+    def __init__(self, latency, jitter, error_rate):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self, rng):
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+
+class FakeServices:
+    def __init__(self, behaviours, seed=None):
+        self.behaviours = behaviours
+        self.images = [make_jpeg(n) for n in range(8)]
+        self.counts = defaultdict(lambda: {'requests': 0, 'errors': 0})
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def begin(self, service):
+        """Sleep the service's latency; True when this call should fail"""
+        behaviour = self.behaviours[service]
+        with self._lock:
+            delay = behaviour.delay(self._rng)
+            fail = self._rng.random() < behaviour.error_rate
+            self.counts[service]['requests'] += 1
+            if fail:
+                self.counts[service]['errors'] += 1
+        time.sleep(delay)
+        return fail
+
+    def gemini_response(self):
+        image = self.images[self._rng.randrange(len(self.images))]
+        return {
+            'candidates': [{
+                'content': {
+                    'role': 'model',
+                    'parts': [{'inlineData': {'mimeType': 'image/jpeg',
+                                              'data': base64.b64encode(image).decode('ascii')}}],
+                },
+                'finishReason': 'STOP',
+            }],
+        }
+
+    def naver_response(self, display):
+        items = []
+        for n in range(display):
+            items.append({
+                'title': f"{NAVER_TITLES[n % len(NAVER_TITLES)]} {n + 1}",
+                'lprice': str(9000 + 1000 * (n % 30)),
+                'image': f"/images/{n % len(self.images)}.jpg",
+                'brand': '',
+                'mallName': NAVER_MALLS[n % len(NAVER_MALLS)],
+            })
+        return {'total': display, 'start': 1, 'display': display, 'items': items}
+
+
+def make_handler(fakes):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status, payload):
+            self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                       'application/json; charset=utf-8')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+            if not GEMINI_PATH.match(urlsplit(self.path).path):
+                return self._json(404, {'error': 'not found'})
+            if fakes.begin('gemini'):
+                return self._json(503, {'error': {'code': 503, 'message': 'fake overload',
+                                                  'status': 'UNAVAILABLE'}})
+            self._json(200, fakes.gemini_response())
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            if url.path == '/stats':
+                return self._json(200, fakes.counts)
+            if url.path == '/naver/v1/search/shop.json':
+                if fakes.begin('naver'):
+                    return self._json(503, {'errorMessage': 'fake overload'})
+                display = min(int(query.get('display', ['10'])[0]), 100)
+                response = fakes.naver_response(display)
+                base = f"http://{self.headers.get('Host')}"
+                for item in response['items']:
+                    item['image'] = base + item['image']
+                return self._json(200, response)
+            match = IMAGE_PATH.match(url.path)
+            if match:
+                if fakes.begin('naver'):
+                    return self._send(503, b'', 'text/plain')
+                image = fakes.images[int(match.group(1)) % len(fakes.images)]
+                return self._send(200, image, 'image/jpeg')
+            if url.path == '/translate':
+                if fakes.begin('translator'):
+                    return self._send(429, b'Too Many Requests', 'text/plain')
+                text = query.get('q', [''])[0]
+                html = f'<html><body><div class="t0">EN {len(text)}: {text}</div></body></html>'
+                return self._send(200, html.encode('utf-8'), 'text/html; charset=utf-8')
+            self._json(404, {'error': 'not found'})
+
+    return Handler
+
+
+def serve(host, port, behaviours, seed=None):
+    """Start the fake services on a daemon thread; returns the server (shutdown() to stop)"""
+    fakes = FakeServices(behaviours, seed)
+    server = ThreadingHTTPServer((host, port), make_handler(fakes))
+    server.daemon_threads = True
+    server.fakes = fakes
+    threading.Thread(target=server.serve_forever, name='fake-services', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--seed', type=int, default=None)
+    defaults = {'gemini': 2.0, 'naver': 0.15, 'translator': 0.1}
+    for service in SERVICES:
+        parser.add_argument(f'--{service}-latency', type=float, default=defaults[service],
+                            help=f'mean {service} latency in seconds (default {defaults[service]})')
+        parser.add_argument(f'--{service}-jitter', type=float, default=defaults[service] / 4,
+                            help='uniform +/- jitter in seconds')
+        parser.add_argument(f'--{service}-error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    behaviours = {
+        service: Behaviour(getattr(args, f'{service}_latency'), getattr(args, f'{service}_jitter'),
+                           getattr(args, f'{service}_error_rate'))
+        for service in SERVICES
+    }
+    server = serve(args.host, args.port, behaviours, args.seed)
+    print(f">>> Fake services on http://{args.host}:{args.port}")
+    for service, behaviour in behaviours.items():
+        print(f"    {service:<10} latency {behaviour.latency}s +/- {behaviour.jitter}s, "
+              f"error rate {behaviour.error_rate}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Closed-loop load test against a running instance, in stages of increasing
+concurrency, to find where throughput stops growing and latency climbs.
+
+    python bench/fake_services.py &                  # stand-ins for Gemini, Naver, translator
+    GEMINI_BASE_URL=http://127.0.0.1:9100/gemini GOOGLE_API_KEY=AIza-loadtest \\
+    NAVER_SHOP_API_URL=http://127.0.0.1:9100/naver/v1/search/shop.json \\
+    TRANSLATOR_BASE_URL=http://127.0.0.1:9100/translate \\
+    WEB_CONCURRENCY=4 WEB_THREADS=4 gunicorn -c gunicorn.conf.py app:app &
+
+    python bench/loadtest.py --stages 4,8,16,32 --duration 30
+    python bench/loadtest.py --mix browse=1 --stages 50 --think-time 0.5
+    python bench/loadtest.py --mix tryon=1 --stages 8 --json tryon.json
+
+Each virtual user loops over scenarios picked by --mix weight:
+  browse   home page, category page, search-as-you-type (one suggestions
+           request per keystroke), search results, product detail
+  shopper  log in, product detail for one of their pets, recommendations
+  cart     log in, add to cart, view cart, change quantity, remove
+  tryon    log in, virtual try-on (Gemini) for one of their pets
+  import   log in, admin product fetch (Naver + translator; writes products,
+           weight 0 unless asked for)
+Setup (not measured) creates --accounts users named <prefix>N, each with a
+pet that has a photo, and collects product ids from the home page.
+
+For every stage it prints throughput and p50/p95/p99 latency per endpoint.
+Run the generator on another machine than the app for numbers that mean
+anything: on one box they share the CPU.
+"""
+import io
+import re
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+
+import requests
+from PIL import Image
+
+
+SEARCH_TERMS = ('coat', 'sweater', 'raincoat', 'hoodie', 'harness', 'dress', 'padding', 'knit')
+CATEGORIES = ('Top', 'Outer', 'Dress', 'Harness&Leash', 'Accessory')
+TRYON_BACKGROUNDS = ('studio', 'park', 'snowy', 'rainy', 'original')
+PRODUCT_LINK = re.compile(r'/product/(\d+)')
+PET_FORM = re.compile(r'/pets/update/(\d+)')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return float('nan')
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+# =======================
+# Recording
+# =======================
+class Recorder:
+    """Latencies (ms) and failures per endpoint label for one stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+
+    def record(self, label, elapsed_ms, error=None):
+        with self._lock:
+            self.latencies[label].append(elapsed_ms)
+            if error:
+                self.errors[label] += 1
+                self.error_samples.setdefault(label, error)
+
+    def summary(self, elapsed):
+        rows = []
+        for label in sorted(self.latencies):
+            values = sorted(self.latencies[label])
+            rows.append({
+                'endpoint': label,
+                'requests': len(values),
+                'errors': self.errors[label],
+                'rps': len(values) / elapsed,
+                'p50_ms': percentile(values, 0.50),
+                'p95_ms': percentile(values, 0.95),
+                'p99_ms': percentile(values, 0.99),
+                'max_ms': values[-1],
+            })
+        everything = sorted(v for values in self.latencies.values() for v in values)
+        total = {
+            'endpoint': 'all',
+            'requests': len(everything),
+            'errors': sum(self.errors.values()),
+            'rps': len(everything) / elapsed,
+            'p50_ms': percentile(everything, 0.50),
+            'p95_ms': percentile(everything, 0.95),
+            'p99_ms': percentile(everything, 0.99),
+            'max_ms': everything[-1] if everything else float('nan'),
+        }
+        return rows, total
+
+
+class Client:
+    """One virtual user's HTTP session; every call is timed under a fixed endpoint label"""
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def reset(self):
+        self.session.close()
+        self.session = requests.Session()
+
+    def call(self, label, method, path, expect=(200,), **kwargs):
+        start = time.perf_counter()
+        error = None
+        response = None
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout,
+                                            allow_redirects=False, **kwargs)
+            response.content  # read the whole body inside the timing
+            if response.status_code not in expect:
+                error = f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        self.recorder.record(label, (time.perf_counter() - start) * 1000, error)
+        return response if error is None else None
+
+    def login(self, account):
+        response = self.call('POST /login', 'POST', '/login', expect=(302,),
+                             data={'username': account['username'], 'password': account['password']})
+        return response is not None and '/mypage' in response.headers.get('Location', '')
+
+
+# =======================
+# Scenarios
+# =======================
+def scenario_browse(client, ctx, rng):
+    client.call('GET /', 'GET', '/')
+    client.call('GET /?category=', 'GET', '/', params={'category': rng.choice(CATEGORIES)})
+    term = rng.choice(SEARCH_TERMS)
+    # Search-as-you-type: the page asks for suggestions from the 2nd keystroke
+    for length in range(2, len(term) + 1):
+        client.call('GET /api/search/suggestions', 'GET', '/api/search/suggestions', params={'q': term[:length]})
+        time.sleep(ctx.keystroke_delay)
+    client.call('GET /?q=', 'GET', '/', params={'q': term})
+    client.call('GET /product/<id>', 'GET', f"/product/{rng.choice(ctx.product_ids)}")
+
+
+def scenario_shopper(client, ctx, rng):
+    account = rng.choice(ctx.accounts)
+    client.reset()
+    if not client.login(account):
+        return
+    pet_id = rng.choice(account['pet_ids'])
+    client.call('GET /product/<id>?pet_id=', 'GET', f"/product/{rng.choice(ctx.product_ids)}",
+                params={'pet_id': pet_id})
+    client.call('GET /recommendations?pet_id=', 'GET', '/recommendations', params={'pet_id': pet_id})
+
+
+def scenario_cart(client, ctx, rng):
+    account = rng.choice(ctx.accounts)
+    client.reset()
+    if not client.login(account):
+        return
+    product_id = rng.choice(ctx.product_ids)
+    client.call('POST /cart/add/<id>', 'POST', f"/cart/add/{product_id}", expect=(302,),
+                data={'size': rng.choice(('S', 'M', 'L')), 'qty': 1})
+    client.call('GET /cart', 'GET', '/cart')
+    client.call('POST /cart/update/<id>', 'POST', f"/cart/update/{product_id}", expect=(302,), data={'qty': 2})
+    client.call('POST /cart/remove/<id>', 'POST', f"/cart/remove/{product_id}", expect=(302,))
+
+
+def scenario_tryon(client, ctx, rng):
+    account = rng.choice(ctx.accounts)
+    client.reset()
+    if not client.login(account):
+        return
+    product_id = rng.choice(ctx.image_product_ids)
+    client.call('POST /api/fit_clothing', 'POST', '/api/fit_clothing', data={
+        'pet_id': rng.choice(account['pet_ids']),
+        'product_id': product_id,
+        'product_name': 'Load test item',
+        'product_image_url': f"/product_image/{product_id}",
+        'background': rng.choice(TRYON_BACKGROUNDS),
+    })
+
+
+def scenario_import(client, ctx, rng):
+    client.reset()
+    if not client.login(rng.choice(ctx.accounts)):
+        return
+    client.call('POST /admin/fetch_products', 'POST', '/admin/fetch_products')
+
+
+SCENARIOS = {
+    'browse': scenario_browse,
+    'shopper': scenario_shopper,
+    'cart': scenario_cart,
+    'tryon': scenario_tryon,
+    'import': scenario_import,
+}
+DEFAULT_MIX = 'browse=55,shopper=25,cart=15,tryon=5'
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("mix needs a positive weight")
+    return mix
+
+
+# =======================
+# Setup
+# =======================
+def pet_photo():
+    out = io.BytesIO()
+    Image.new('RGB', (320, 320), (200, 160, 110)).save(out, 'JPEG', quality=85)
+    return out.getvalue()
+
+
+def ensure_account(base_url, username, password, timeout):
+    """Register (if needed) and log in; make sure the user has a pet with a photo; returns the account"""
+    session = requests.Session()
+    url = base_url.rstrip('/')
+
+    def login():
+        r = session.post(url + '/login', data={'username': username, 'password': password},
+                         allow_redirects=False, timeout=timeout)
+        return r.status_code == 302 and '/mypage' in r.headers.get('Location', '')
+
+    if not login():
+        session.post(url + '/register', data={'username': username, 'email': f"{username}@loadtest.invalid",
+                                              'password': password}, allow_redirects=False, timeout=timeout)
+        if not login():
+            raise SystemExit(f"could not register or log in as {username}")
+
+    def pet_ids():
+        page = session.get(url + '/mypage', allow_redirects=False, timeout=timeout)
+        return sorted(set(int(pet_id) for pet_id in PET_FORM.findall(page.text))) if page.status_code == 200 else []
+
+    ids = pet_ids()
+    if not ids:
+        session.post(url + '/pets/add', data={
+            'pet_name': f"{username}-pet", 'weight_kg': '6.5',
+            'weather_preference': 'cold', 'style_preference': 'classic',
+        }, files={'pet_image': ('pet.jpg', pet_photo(), 'image/jpeg')}, allow_redirects=False, timeout=timeout)
+        ids = pet_ids()
+        if not ids:
+            raise SystemExit(f"could not create a pet for {username}")
+    session.close()
+    return {'username': username, 'password': password, 'pet_ids': ids}
+
+
+def product_ids(base_url, timeout):
+    ids = set()
+    for params in [{}] + [{'category': category} for category in CATEGORIES]:
+        page = requests.get(base_url.rstrip('/') + '/', params=params, timeout=timeout)
+        ids.update(int(product_id) for product_id in PRODUCT_LINK.findall(page.text))
+    if not ids:
+        raise SystemExit("no products found on the home page")
+    return sorted(ids)
+
+
+def products_with_images(base_url, ids, timeout):
+    """Products whose image is stored (the others redirect to a placeholder try-on cannot use)"""
+    url = base_url.rstrip('/')
+    return [product_id for product_id in ids
+            if requests.get(f"{url}/product_image/{product_id}", allow_redirects=False,
+                            timeout=timeout).status_code == 200]
+
+
+class Context:
+    def __init__(self, accounts, product_ids, image_product_ids, keystroke_delay):
+        self.accounts = accounts
+        self.product_ids = product_ids
+        self.image_product_ids = image_product_ids or product_ids
+        self.keystroke_delay = keystroke_delay
+
+
+# =======================
+# Stages
+# =======================
+def run_stage(args, ctx, users, mix):
+    recorder = Recorder()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    deadline = time.monotonic() + args.duration
+
+    def virtual_user(index):
+        rng = random.Random(args.seed * 1000 + index if args.seed is not None else None)
+        client = Client(args.base_url, recorder, args.timeout)
+        try:
+            while time.monotonic() < deadline:
+                SCENARIOS[rng.choices(names, weights)[0]](client, ctx, rng)
+                if args.think_time:
+                    time.sleep(rng.expovariate(1 / args.think_time))
+        finally:
+            client.session.close()
+
+    threads = [threading.Thread(target=virtual_user, args=(i,), daemon=True) for i in range(users)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Scenarios finish their last step after the deadline: rate over the real time
+    return recorder, time.monotonic() - start
+
+
+def print_stage(users, recorder, elapsed):
+    rows, total = recorder.summary(elapsed)
+    print(f"\n{users} users, {elapsed:.1f}s: {total['requests']} requests, {total['rps']:.1f} req/s, "
+          f"{total['errors']} errors")
+    print(f"  {'endpoint':<34} {'reqs':>6} {'err':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for row in rows + [total]:
+        print(f"  {row['endpoint']:<34} {row['requests']:>6} {row['errors']:>5} {row['rps']:>7.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+    for label, sample in sorted(recorder.error_samples.items()):
+        print(f"  ! {label}: {recorder.errors[label]} errors, e.g. {sample}")
+    return {'users': users, 'seconds': elapsed, 'endpoints': rows, 'total': total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--stages', default='4,8,16,32', help='concurrent virtual users per stage')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per stage')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='mean pause between scenarios in seconds (0 = saturate)')
+    parser.add_argument('--keystroke-delay', type=float, default=0.12, help='pause between search keystrokes')
+    parser.add_argument('--accounts', type=int, default=20, help='test users to create/reuse')
+    parser.add_argument('--account-prefix', default='loadtest')
+    parser.add_argument('--password', default='loadtest-password')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    stages = [int(users) for users in args.stages.split(',') if users.strip()]
+    print(f"Setting up {args.accounts} accounts against {args.base_url} ...")
+    accounts = [ensure_account(args.base_url, f"{args.account_prefix}{n}", args.password, args.timeout)
+                for n in range(args.accounts)]
+    ids = product_ids(args.base_url, args.timeout)
+    with_images = products_with_images(args.base_url, ids, args.timeout)
+    ctx = Context(accounts, ids, with_images, args.keystroke_delay)
+    mix = {name: weight for name, weight in args.mix.items() if weight > 0}
+    print(f"{len(ids)} products ({len(with_images)} with images); mix {mix}; "
+          f"{args.duration:.0f}s per stage, think time {args.think_time}s")
+    if 'tryon' in mix and not with_images:
+        print("  ! no product has a stored image: try-ons will fail to fetch one and skip Gemini")
+
+    results = []
+    for users in stages:
+        recorder, elapsed = run_stage(args, ctx, users, mix)
+        results.append(print_stage(users, recorder, elapsed))
+
+    print("\nStage summary (saturation: req/s stops growing while p95 climbs)")
+    print(f"  {'users':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for result in results:
+        total = result['total']
+        print(f"  {result['users']:>6} {total['rps']:>8.1f} {total['p50_ms']:>8.1f} {total['p95_ms']:>8.1f} "
+              f"{total['p99_ms']:>8.1f} {total['errors']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'base_url': args.base_url, 'mix': mix, 'stages': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
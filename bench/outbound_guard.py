@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Exercise an outbound Guard against a local fault-injecting stub (no network).
+
+    python bench/outbound_guard.py                              # healthy dependency
+    python bench/outbound_guard.py --latency 3                  # slow: timeouts, then open breaker
+    python bench/outbound_guard.py --error-rate 1 --requests 40 # hard down
+    python bench/outbound_guard.py --threads 32 --latency 0.5   # overload: queue-full rejections
+
+Simulates --threads callers each making --requests calls through a Guard
+configured like the app's (see outbound.py), and reports how many calls
+succeeded, failed, timed out or were rejected, the caller-side latency of
+each outcome, and the final breaker state.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import outbound  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=10, help='calls per thread')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--queue', type=int, default=8)
+    parser.add_argument('--queue-wait', type=float, default=1.0)
+    parser.add_argument('--timeout-floor', type=float, default=0.2)
+    parser.add_argument('--timeout-ceiling', type=float, default=1.0)
+    parser.add_argument('--failure-threshold', type=int, default=5)
+    parser.add_argument('--reset-seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    guard = outbound.Guard(
+        'stub',
+        max_concurrency=args.concurrency,
+        max_queue=args.queue,
+        queue_wait=args.queue_wait,
+        timeout_floor=args.timeout_floor,
+        timeout_ceiling=args.timeout_ceiling,
+        failure_threshold=args.failure_threshold,
+        reset_seconds=args.reset_seconds,
+    )
+    call = outbound.stub(guard, result='ok', latency=args.latency, error_rate=args.error_rate, seed=1)
+
+    outcomes = defaultdict(list)
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            try:
+                call()
+                outcome = 'ok'
+            except outbound.QueueFull:
+                outcome = 'rejected_queue_full'
+            except outbound.CircuitOpen:
+                outcome = 'rejected_circuit_open'
+            except outbound.InjectedTimeout:
+                outcome = 'timeout'
+            except outbound.InjectedFault:
+                outcome = 'error'
+            with lock:
+                outcomes[outcome].append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = args.threads * args.requests
+    print(f"{total} calls in {elapsed:.2f}s ({args.threads} threads, stub latency {args.latency}s, "
+          f"error rate {args.error_rate})")
+    for outcome, latencies in sorted(outcomes.items()):
+        print(f"  {outcome:<22} {len(latencies):>5}  "
+              f"median {statistics.median(latencies):8.1f} ms  max {max(latencies):8.1f} ms")
+
+    state = guard.state()
+    print(f"breaker: {state['state']}, timeout now {state['timeout_s']}s, p95 latency {state['p95_latency_s']}")
+    print(f"counters: {state['counters']}")
+
+
+if __name__ == '__main__':
+    main()
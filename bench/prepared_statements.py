@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Planning overhead of the hot queries, plain SQL vs the prepared-statement
+registry (db.statement / db.execute), on one pooled connection.
+
+    DATABASE_URL=... python bench/prepared_statements.py
+    DATABASE_URL=... python bench/prepared_statements.py --iterations 500 --pet-id 3
+
+For the listing path (home page variants, incl. the fits-my-pet filter) and the recommendation path
+(pet lookup, SQL scoring engine, winner details) it reports:
+  - client-side time per call, each statement run --iterations times
+  - server-side "Planning Time" from EXPLAIN (ANALYZE), for the plain query
+    and for EXECUTE of the prepared one once its generic plan is cached
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('SLOW_QUERY_LOG', '')
+
+import app  # noqa: E402
+import db  # noqa: E402
+
+_PLANNING_TIME = re.compile(r"Planning Time: ([\d.]+) ms")
+
+
+def listing_cases(cur, pet_id):
+    pattern = '%coat%'
+    cur.execute("SELECT category FROM products WHERE active = TRUE AND category IS NOT NULL LIMIT 1")
+    row = cur.fetchone()
+    category = row['category'] if row else 'Coats'
+    _, pet_context = app.load_pet_for_recommendations(cur, pet_id)
+    fit = 'weight' if pet_context['weight_kg'] else 'size'
+    params = {'category': category, 'pattern': pattern, 'price': None, 'weather': None, 'style': None,
+              **app.listing_fit_params(pet_context)}
+    return [
+        (app.LISTING_STATEMENTS[(False, False, 'newest', None, False)], params),
+        (app.LISTING_STATEMENTS[(False, False, 'best', None, False)], params),
+        (app.LISTING_STATEMENTS[(True, False, 'newest', None, False)], params),
+        (app.LISTING_STATEMENTS[(False, True, 'newest', None, True)], params),
+        (app.LISTING_STATEMENTS[(True, True, 'newest', None, True)], params),
+        (app.LISTING_STATEMENTS[(False, False, 'newest', fit, True)], params),
+        (app.LISTING_STATEMENTS[(True, True, 'best', fit, True)], params),
+        (app.FEATURED_PRODUCTS, None),
+    ]
+
+
+def recommendation_cases(cur, pet_id):
+    _, pet_context = app.load_pet_for_recommendations(cur, pet_id)
+    if pet_context is None:
+        sys.exit(f"pet {pet_id} not found")
+    dimensions = pet_context['dimensions']
+    weight = pet_context['weight_kg']
+    score_params = {
+        'chest': float(dimensions['chest_cm']),
+        'back': float(dimensions['back_cm']),
+        'neck': float(dimensions['neck_cm']) if dimensions['neck_cm'] else None,
+        'weight': float(weight) if weight else None,
+        'weather': pet_context['weather_pref'],
+        'style': pet_context['style_pref'],
+        'top_n': 3,
+    }
+    db.execute(cur, app.RECOMMENDATION_SCORE, score_params)
+    size_ids = [row['size_id'] for row in cur.fetchall()]
+    return [
+        (app.PET_FOR_RECOMMENDATIONS, (pet_id,)),
+        (app.RECOMMENDATION_SCORE, score_params),
+        (app.RECOMMENDATION_DETAILS, (size_ids,)),
+    ]
+
+
+def time_calls(cur, run, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        cur.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def planning_ms(conn, query, params):
+    cur = conn.cursor()
+    try:
+        cur.execute("EXPLAIN (ANALYZE) " + query, params)
+        plan = "\n".join(row[0] for row in cur.fetchall())
+    finally:
+        cur.close()
+    match = _PLANNING_TIME.search(plan)
+    return float(match.group(1)) if match else float('nan')
+
+
+def bench(cur, title, cases, iterations):
+    print(f"\n{title}")
+    print(f"  {'statement':<48} {'plain ms':>9} {'prepared ms':>12}   {'plan ms (plain)':>15} {'plan ms (prepared)':>18}")
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for statement, params in cases:
+        plain = time_calls(cur, lambda: cur.execute(statement.sql, params), iterations)
+        prepared = time_calls(cur, lambda: db.execute(cur, statement, params), iterations)
+        plain_plan = planning_ms(cur.connection, statement.sql, params)
+        arguments = statement.arguments(params)
+        execute_sql = f"EXECUTE {statement.name}" + (f" ({', '.join(['%s'] * len(arguments))})" if arguments else "")
+        prepared_plan = planning_ms(cur.connection, execute_sql, arguments or None)
+        for i, value in enumerate((plain, prepared, plain_plan, prepared_plan)):
+            totals[i] += value
+        print(f"  {statement.name:<48} {plain:9.3f} {prepared:12.3f}   {plain_plan:15.3f} {prepared_plan:18.3f}")
+    print(f"  {'total':<48} {totals[0]:9.3f} {totals[1]:12.3f}   {totals[2]:15.3f} {totals[3]:18.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200, help='calls per statement and mode')
+    parser.add_argument('--pet-id', type=int, help='pet for the recommendation path (default: first pet)')
+    args = parser.parse_args()
+
+    conn = app.get_db()
+    cur = conn.cursor(cursor_factory=app.RealDictCursor)
+    try:
+        pet_id = args.pet_id
+        if pet_id is None:
+            cur.execute("SELECT id FROM pets ORDER BY id LIMIT 1")
+            row = cur.fetchone()
+            if row is None:
+                sys.exit("no pets in the database")
+            pet_id = row['id']
+
+        print(f"{args.iterations} calls per statement and mode, median per call; pet {pet_id}")
+        bench(cur, "Listing path", listing_cases(cur, pet_id), args.iterations)
+        bench(cur, "Recommendation path", recommendation_cases(cur, pet_id), args.iterations)
+    finally:
+        cur.close()
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: time from launching the server to the first served request.
+
+    python bench/startup.py                   # gunicorn (pre-fork, warm caches)
+    python bench/startup.py --mode dev        # python app.py (debug server)
+    python bench/startup.py --path /api/breeds --runs 5
+
+Reports, per run, seconds until the first 2xx/3xx response and the latency
+of that first request and of the next few (cold vs warm caches).
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+    'dev': [sys.executable, 'app.py'],
+}
+
+
+def fetch(url, timeout=30):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, (time.perf_counter() - start) * 1000
+
+
+def run_once(mode, port, path, followups):
+    env = dict(os.environ, PORT=str(port), BIND=f"127.0.0.1:{port}", WEB_ACCESS_LOG='/dev/null')
+    url = f"http://127.0.0.1:{port}{path}"
+    launched = time.perf_counter()
+    proc = subprocess.Popen(COMMANDS[mode], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            try:
+                status, first_ms = fetch(url)
+                if status < 400:
+                    break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.05)
+        ready_s = time.perf_counter() - launched
+        warm_ms = [fetch(url)[1] for _ in range(followups)]
+        return ready_s, first_ms, warm_ms
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=sorted(COMMANDS), default='gunicorn')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--followups', type=int, default=5)
+    args = parser.parse_args()
+
+    ready, first = [], []
+    for run in range(args.runs):
+        ready_s, first_ms, warm_ms = run_once(args.mode, args.port, args.path, args.followups)
+        ready.append(ready_s)
+        first.append(first_ms)
+        print(f"run {run + 1}: first response after {ready_s:.2f}s, "
+              f"first request {first_ms:.1f} ms, next {statistics.median(warm_ms):.1f} ms (median)")
+
+    print(f"{args.mode}: time to first served request median {statistics.median(ready):.2f}s, "
+          f"first request median {statistics.median(first):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,439 @@
+"""
+In-process catalog snapshot for the recommender.
+
+The snapshot holds only the scoring features of every active product size
+(ids, measurements, weight band, price, popularity, tags, category) in
+compact column arrays, in the same (product id, size label) order the
+recommender uses for tie-breaking. Display fields are looked up for the
+winners only.
+
+A per-category grid over (chest_cm, back_cm) lets the recommender fetch
+only the sizes that are close enough to the pet's estimated dimensions to
+still beat the best candidate found so far.
+
+The columns can be exported to a versioned binary file (CATALOG_SNAPSHOT_FILE)
+that processes mmap read-only: every worker shares one page-cache copy, and
+a worker starting up with the file present needs no catalog query.
+"""
+import os
+import sys
+import copy
+import json
+import math
+import mmap
+import time
+import struct
+import tempfile
+import threading
+from array import array
+
+import db
+
+
+CATALOG_VERSION_CHECK_SECONDS = float(os.environ.get('CATALOG_VERSION_CHECK_SECONDS', '5'))
+CATALOG_GRID_CELL_CM = float(os.environ.get('CATALOG_GRID_CELL_CM', '5'))
+# Empty disables the file (every process loads the catalog from Postgres)
+CATALOG_SNAPSHOT_FILE = os.environ.get('CATALOG_SNAPSHOT_FILE', os.path.join('snapshots', 'catalog.bin'))
+
+
+class CatalogSnapshot:
+    """Column-oriented scoring features of the active catalog"""
+
+    def __init__(self, version=None, popularity_version=None):
+        self.version = version
+        self.popularity_version = popularity_version
+        self.loaded_at = time.time()
+        self.product_ids = array('q')
+        self.size_ids = array('q')
+        self.category_codes = array('H')
+        self.chest_cm = array('d')
+        self.back_cm = array('d')
+        self.neck_cm = array('d')          # 0.0 when unknown
+        self.weight_min_kg = array('d')    # 0.0 when unknown
+        self.weight_max_kg = array('d')    # 0.0 when unknown
+        self.price_cents = array('q')
+        self.popularity = array('d')
+        self.weather_codes = array('H')
+        self.style_codes = array('H')
+        # Code -> value tables; index 0 is always None
+        self.categories = [None]
+        self.weather_tags = [None]
+        self.style_tags = [None]
+        self._codes = {}
+        self.index = None
+        self.source = 'database'
+
+    def __len__(self):
+        return len(self.size_ids)
+
+    def _encode(self, table, value):
+        key = (id(table), value)
+        code = self._codes.get(key)
+        if code is None:
+            if value is None:
+                return 0
+            code = len(table)
+            table.append(value)
+            self._codes[key] = code
+        return code
+
+    def append(self, product_id, category, price_cents, weather_tag, style_tag, popularity,
+               size_id, chest_cm, back_cm, neck_cm, weight_min_kg, weight_max_kg):
+        self.product_ids.append(product_id)
+        self.size_ids.append(size_id)
+        self.category_codes.append(self._encode(self.categories, category))
+        self.chest_cm.append(float(chest_cm))
+        self.back_cm.append(float(back_cm))
+        self.neck_cm.append(float(neck_cm or 0))
+        self.weight_min_kg.append(float(weight_min_kg or 0))
+        self.weight_max_kg.append(float(weight_max_kg or 0))
+        self.price_cents.append(int(price_cents))
+        self.popularity.append(float(popularity) if popularity is not None else math.nan)
+        self.weather_codes.append(self._encode(self.weather_tags, weather_tag))
+        self.style_codes.append(self._encode(self.style_tags, style_tag))
+
+    def build_index(self):
+        self.index = SizeGridIndex(self)
+        return self.index
+
+
+class CategoryStats:
+    """Per-category bounds used to prune candidates"""
+
+    def __init__(self):
+        self.rows = []
+        self.weather_codes = set()
+        self.style_codes = set()
+        self.min_price_cents = None
+        self.max_popularity = -math.inf
+
+    def add(self, row, weather_code, style_code, price_cents, popularity):
+        self.rows.append(row)
+        self.weather_codes.add(weather_code)
+        self.style_codes.add(style_code)
+        if self.min_price_cents is None or price_cents < self.min_price_cents:
+            self.min_price_cents = price_cents
+        if popularity > self.max_popularity:
+            self.max_popularity = popularity
+
+
+class SizeGridIndex:
+    """
+    Uniform grid over (chest_cm, back_cm), one grid per category.
+    candidates() returns the rows whose chest+back L1 distance to a point
+    is within a radius; since chest and back differences are part of the
+    fit score's total difference, this is a safe superset for fit bounds.
+    """
+
+    def __init__(self, snapshot, cell_cm=CATALOG_GRID_CELL_CM):
+        self.snapshot = snapshot
+        self.cell_cm = cell_cm
+        self.grids = {}
+        self.stats = {}
+        for row in range(len(snapshot)):
+            category_code = snapshot.category_codes[row]
+            key = self._cell(snapshot.chest_cm[row], snapshot.back_cm[row])
+            self.grids.setdefault(category_code, {}).setdefault(key, []).append(row)
+            stats = self.stats.get(category_code)
+            if stats is None:
+                stats = self.stats[category_code] = CategoryStats()
+            stats.add(row, snapshot.weather_codes[row], snapshot.style_codes[row],
+                      snapshot.price_cents[row], snapshot.popularity[row])
+
+    def _cell(self, chest_cm, back_cm):
+        return int(chest_cm // self.cell_cm), int(back_cm // self.cell_cm)
+
+    def candidates(self, category_code, chest_cm, back_cm, radius):
+        """Rows in the category with |chest diff| + |back diff| <= radius"""
+        if math.isinf(radius):
+            return list(self.stats[category_code].rows)
+
+        grid = self.grids[category_code]
+        lo_x, lo_y = self._cell(chest_cm - radius, back_cm - radius)
+        hi_x, hi_y = self._cell(chest_cm + radius, back_cm + radius)
+
+        if (hi_x - lo_x + 1) * (hi_y - lo_y + 1) > len(grid):
+            cells = [rows for (x, y), rows in grid.items() if lo_x <= x <= hi_x and lo_y <= y <= hi_y]
+        else:
+            cells = [grid[(x, y)] for x in range(lo_x, hi_x + 1) for y in range(lo_y, hi_y + 1) if (x, y) in grid]
+
+        chest = self.snapshot.chest_cm
+        back = self.snapshot.back_cm
+        limit = radius + 1e-9
+        return [
+            row for rows in cells for row in rows
+            if abs(chest_cm - chest[row]) + abs(back_cm - back[row]) <= limit
+        ]
+
+
+# =======================
+# Snapshot file (mmap)
+# =======================
+# Layout: header, JSON metadata (byte order, column list, tag tables), then
+# each column as raw native-endian values, 8-byte aligned, in SNAPSHOT_COLUMNS order.
+SNAPSHOT_MAGIC = b'PFCAT\x00\x00\x01'
+SNAPSHOT_HEADER = struct.Struct('<8sqQQ')  # magic, catalog version (-1 unknown), rows, metadata bytes
+SNAPSHOT_COLUMNS = (
+    ('product_ids', 'q'), ('size_ids', 'q'), ('category_codes', 'H'),
+    ('chest_cm', 'd'), ('back_cm', 'd'), ('neck_cm', 'd'),
+    ('weight_min_kg', 'd'), ('weight_max_kg', 'd'),
+    ('price_cents', 'q'), ('popularity', 'd'),
+    ('weather_codes', 'H'), ('style_codes', 'H'),
+)
+
+
+class SnapshotFileError(ValueError):
+    """Snapshot file is missing pieces, from another format, or from another byte order"""
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def export_snapshot_file(snapshot, path=None):
+    """
+    Write the snapshot's columns to path (default CATALOG_SNAPSHOT_FILE).
+    The file is written next to the target and renamed into place, so
+    readers see the old file or the new one, and existing mmaps of the old
+    file stay valid. Returns the path.
+    """
+    path = path or CATALOG_SNAPSHOT_FILE
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    metadata = json.dumps({
+        'byteorder': sys.byteorder,
+        'columns': SNAPSHOT_COLUMNS,
+        'categories': snapshot.categories,
+        'weather_tags': snapshot.weather_tags,
+        'style_tags': snapshot.style_tags,
+        'popularity_version': snapshot.popularity_version,
+        'exported_at': time.time(),
+    }).encode('utf-8')
+
+    fd, temp_path = tempfile.mkstemp(prefix='.catalog_', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            version = snapshot.version if snapshot.version is not None else -1
+            out.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, version, len(snapshot), len(metadata)))
+            out.write(metadata)
+            for name, typecode in SNAPSHOT_COLUMNS:
+                out.write(b'\x00' * (_aligned(out.tell()) - out.tell()))
+                out.write(array(typecode, getattr(snapshot, name)).tobytes())
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+
+def open_snapshot_file(path=None):
+    """
+    Map a snapshot file read-only and return a CatalogSnapshot whose columns
+    are memoryviews into the mapping (with its grid index built), or None if
+    the file does not exist.
+    """
+    path = path or CATALOG_SNAPSHOT_FILE
+    try:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:  # empty file
+        raise SnapshotFileError(f"{path}: {e}")
+
+    if len(mapping) < SNAPSHOT_HEADER.size:
+        raise SnapshotFileError(f"{path}: truncated header")
+    magic, version, rows, metadata_size = SNAPSHOT_HEADER.unpack_from(mapping, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotFileError(f"{path}: not a catalog snapshot (or an older format)")
+    metadata = json.loads(mapping[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + metadata_size])
+    if metadata['byteorder'] != sys.byteorder:
+        raise SnapshotFileError(f"{path}: written on a {metadata['byteorder']}-endian machine")
+    if [tuple(column) for column in metadata['columns']] != list(SNAPSHOT_COLUMNS):
+        raise SnapshotFileError(f"{path}: columns differ from this version of the app")
+
+    snapshot = CatalogSnapshot(None if version == -1 else version, metadata.get('popularity_version'))
+    snapshot.loaded_at = metadata['exported_at']
+    snapshot.categories = metadata['categories']
+    snapshot.weather_tags = metadata['weather_tags']
+    snapshot.style_tags = metadata['style_tags']
+    view = memoryview(mapping)
+    end = SNAPSHOT_HEADER.size + metadata_size
+    for name, typecode in SNAPSHOT_COLUMNS:
+        offset = _aligned(end)
+        end = offset + rows * array(typecode).itemsize
+        if end > len(mapping):
+            raise SnapshotFileError(f"{path}: column {name} is truncated")
+        setattr(snapshot, name, view[offset:end].cast(typecode))
+    snapshot.source = path
+    snapshot.build_index()
+    return snapshot
+
+
+def _open_snapshot_file_quietly(version=None):
+    """open_snapshot_file() that logs instead of raising; None unless it matches version (if given)"""
+    if not CATALOG_SNAPSHOT_FILE:
+        return None
+    try:
+        snapshot = open_snapshot_file()
+    except (OSError, ValueError, KeyError) as e:
+        print(f">>> Catalog snapshot file unusable, loading from the database: {e}")
+        return None
+    if snapshot is None or (version is not None and snapshot.version != version):
+        return None
+    return snapshot
+
+
+# =======================
+# Snapshot loading and refresh
+# =======================
+CATALOG_SNAPSHOT_SQL = """
+    SELECT p.id, p.category, p.base_price_cents, p.weather_tag, p.style_tag, p.popularity_score,
+           ps.id, ps.chest_cm, ps.back_cm, ps.neck_cm, ps.weight_min_kg, ps.weight_max_kg
+    FROM products p
+    JOIN product_sizes ps ON p.id = ps.product_id
+    WHERE p.active = TRUE
+    ORDER BY p.id, ps.label
+"""
+
+
+CATALOG_POPULARITY_SQL = "SELECT id, popularity_score FROM products WHERE active = TRUE"
+
+
+CATALOG_VERSION = db.statement('catalog_version', "SELECT version, popularity_version FROM catalog_version")
+
+
+def fetch_catalog_versions(conn):
+    """
+    (catalog version, popularity version): the first is bumped by triggers
+    on products/product_sizes, except for popularity_score changes, which
+    bump the second (jobs.update_popularity)
+    """
+    cur = conn.cursor()
+    try:
+        db.execute(cur, CATALOG_VERSION)
+        row = cur.fetchone()
+        return (row[0], row[1]) if row else (None, None)
+    finally:
+        cur.close()
+
+
+def fetch_catalog_version(conn):
+    """Current catalog_version (bumped by triggers on products/product_sizes)"""
+    return fetch_catalog_versions(conn)[0]
+
+
+def load_catalog_snapshot(conn, itersize=5000):
+    """Stream the active catalog into a new indexed snapshot"""
+    snapshot = CatalogSnapshot(*fetch_catalog_versions(conn))
+    cur = conn.cursor(name='catalog_snapshot')
+    cur.itersize = itersize
+    cur.execute(CATALOG_SNAPSHOT_SQL)
+    for row in cur:
+        snapshot.append(*row)
+    cur.close()
+    conn.rollback()
+    snapshot.build_index()
+    return snapshot
+
+
+def refresh_popularity(conn, snapshot, popularity_version):
+    """
+    Copy of snapshot with the popularity column re-read from products and
+    the index rebuilt. The other columns are shared (with a mapped file,
+    they stay in the shared mapping).
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(CATALOG_POPULARITY_SQL)
+        scores = dict(cur.fetchall())
+    finally:
+        cur.close()
+    conn.rollback()
+
+    popularity = array('d', snapshot.popularity)
+    for row, product_id in enumerate(snapshot.product_ids):
+        if product_id in scores:
+            score = scores[product_id]
+            popularity[row] = float(score) if score is not None else math.nan
+
+    refreshed = copy.copy(snapshot)
+    refreshed.popularity = popularity
+    refreshed.popularity_version = popularity_version
+    refreshed.build_index()
+    return refreshed
+
+
+_snapshot = None
+_snapshot_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def get_catalog_snapshot(get_conn):
+    """
+    Return the current snapshot, reloading it when catalog_version changed.
+    The version is checked at most every CATALOG_VERSION_CHECK_SECONDS.
+    When only the popularity version changed, just the popularity column
+    is refreshed (refresh_popularity), in this process only.
+
+    With CATALOG_SNAPSHOT_FILE set, the first call maps the file without
+    touching the database (the regular version check catches up within
+    CATALOG_VERSION_CHECK_SECONDS if it was stale). On a version change the
+    file is used if another process already exported that version;
+    otherwise the catalog is loaded from Postgres and exported for the rest.
+    """
+    global _snapshot, _snapshot_checked_at
+    now = time.monotonic()
+    snapshot = _snapshot
+    if snapshot is not None and now - _snapshot_checked_at < CATALOG_VERSION_CHECK_SECONDS:
+        return snapshot
+
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() - _snapshot_checked_at < CATALOG_VERSION_CHECK_SECONDS:
+            return _snapshot
+        if _snapshot is None:
+            mapped = _open_snapshot_file_quietly()
+            if mapped is not None:
+                _snapshot = mapped
+                _snapshot_checked_at = time.monotonic()
+                print(f">>> Catalog snapshot mapped: {len(_snapshot)} sizes (version {_snapshot.version})")
+                return _snapshot
+
+        conn = get_conn()
+        try:
+            version, popularity_version = fetch_catalog_versions(conn)
+            if _snapshot is None or version != _snapshot.version:
+                mapped = _open_snapshot_file_quietly(version)
+                if mapped is not None:
+                    _snapshot = mapped
+                    print(f">>> Catalog snapshot mapped: {len(_snapshot)} sizes (version {_snapshot.version})")
+                else:
+                    _snapshot = load_catalog_snapshot(conn)
+                    print(f">>> Catalog snapshot loaded: {len(_snapshot)} sizes (version {_snapshot.version})")
+                    if CATALOG_SNAPSHOT_FILE:
+                        try:
+                            export_snapshot_file(_snapshot)
+                        except OSError as e:
+                            print(f">>> Catalog snapshot export error: {e}")
+                        else:
+                            # Switch to the shared mapping so this process holds no private copy
+                            _snapshot = _open_snapshot_file_quietly(version) or _snapshot
+            if popularity_version is not None and (_snapshot.popularity_version is None
+                                                   or popularity_version > _snapshot.popularity_version):
+                _snapshot = refresh_popularity(conn, _snapshot, popularity_version)
+                print(f">>> Catalog snapshot popularity refreshed (popularity version {popularity_version})")
+            _snapshot_checked_at = time.monotonic()
+        finally:
+            conn.close()
+        return _snapshot
+
+
+def invalidate_catalog_snapshot():
+    """Force a version check on the next get_catalog_snapshot() call"""
+    global _snapshot_checked_at
+    _snapshot_checked_at = 0.0
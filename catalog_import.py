@@ -0,0 +1,476 @@
+"""
+Bulk catalog import (`flask import-catalog`).
+
+Reads a product manifest and an optional size manifest (CSV or JSONL, by
+file extension) plus an image directory, and upserts everything into
+products / product_sizes in one transaction:
+
+  1. manifests are parsed and checked row by row; bad rows are reported
+     and skipped
+  2. product images are read, hashed (sha256 of the source file),
+     validated and normalized (images.normalize_image) on a process pool;
+     images whose hash matches products.image_hash are not re-encoded
+  3. rows are streamed with COPY into temp staging tables while images
+     are still being processed
+  4. one INSERT ... ON CONFLICT (external_ref) per table moves them into
+     place; unchanged rows are not rewritten
+
+Products are matched on external_ref (the manifest's stable id). On update,
+popularity_score is left to the popularity job, and a product whose
+manifest row has no (readable) image keeps its stored one.
+
+Product columns: external_ref, name, brand, category, description,
+base_price_cents, weather_tag, style_tag, popularity_score, active, image.
+Size columns: product_ref, label, chest_cm, back_cm, neck_cm,
+weight_min_kg, weight_max_kg, sku, stock_qty. A JSONL product may instead
+carry its sizes inline as "sizes": [{label, chest_cm, ...}, ...].
+"""
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+import images
+
+
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', str(os.cpu_count() or 2)))
+IMPORT_MAX_ERRORS_SHOWN = 20
+COPY_CHUNK_SIZE = 256 * 1024
+
+SIZE_FIELDS = ('product_ref', 'label', 'chest_cm', 'back_cm', 'neck_cm',
+               'weight_min_kg', 'weight_max_kg', 'sku', 'stock_qty')
+
+
+class ManifestError(ValueError):
+    """A manifest row that can't be imported"""
+
+
+# =======================
+# Manifests
+# =======================
+def read_manifest(path):
+    """Yield (line number, dict or ManifestError) from a .csv or .jsonl/.ndjson file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.csv', '.jsonl', '.ndjson'):
+        raise ManifestError(f"{path}: expected a .csv or .jsonl manifest")
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if extension == '.csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line, parse_float=Decimal)
+                except json.JSONDecodeError as e:
+                    yield line_number, ManifestError(f"invalid JSON: {e}")
+                    continue
+                yield line_number, row if isinstance(row, dict) else ManifestError("expected a JSON object")
+
+
+def _text(row, key, required=False):
+    value = row.get(key)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise ManifestError(f"{key} is required")
+        return None
+    return str(value).strip()
+
+
+def _number(row, key, kind=Decimal, required=False):
+    value = _text(row, key, required)
+    if value is None:
+        return None
+    try:
+        return kind(value)
+    except (InvalidOperation, ValueError):
+        raise ManifestError(f"{key} is not a number: {value!r}")
+
+
+def _flag(row, key):
+    value = row.get(key)
+    if value is None or value == '':
+        return True
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).strip().lower()
+    if lowered in ('1', 'true', 't', 'yes', 'y'):
+        return True
+    if lowered in ('0', 'false', 'f', 'no', 'n'):
+        return False
+    raise ManifestError(f"{key} is not a boolean: {value!r}")
+
+
+def parse_product(row):
+    return {
+        'external_ref': _text(row, 'external_ref', required=True),
+        'name': _text(row, 'name', required=True),
+        'brand': _text(row, 'brand'),
+        'category': _text(row, 'category'),
+        'description': _text(row, 'description'),
+        'base_price_cents': _number(row, 'base_price_cents', int, required=True),
+        'weather_tag': _text(row, 'weather_tag'),
+        'style_tag': _text(row, 'style_tag'),
+        'popularity_score': _number(row, 'popularity_score'),
+        'active': _flag(row, 'active'),
+        'image': _text(row, 'image'),
+    }
+
+
+def parse_size(row, product_ref=None):
+    return {
+        'product_ref': product_ref or _text(row, 'product_ref', required=True),
+        'label': _text(row, 'label', required=True),
+        'chest_cm': _number(row, 'chest_cm', required=True),
+        'back_cm': _number(row, 'back_cm', required=True),
+        'neck_cm': _number(row, 'neck_cm'),
+        'weight_min_kg': _number(row, 'weight_min_kg'),
+        'weight_max_kg': _number(row, 'weight_max_kg'),
+        'sku': _text(row, 'sku'),
+        'stock_qty': _number(row, 'stock_qty', int),
+    }
+
+
+# =======================
+# Image processing (runs in worker processes)
+# =======================
+def process_image(path, known_hash):
+    """
+    Returns (sha256 of the source file, jpeg bytes or None, error or None).
+    Bytes are None when the hash matches known_hash (already stored).
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return None, None, f"cannot read image {path}: {e.strerror}"
+    digest = hashlib.sha256(data).hexdigest()
+    if digest == known_hash:
+        return digest, None, None
+    try:
+        images.validate_image(io.BytesIO(data))
+        jpeg, _ = images.normalize_image_bytes(data)
+    except images.ImageValidationError as e:
+        return None, None, f"{path}: {e}"
+    return digest, jpeg, None
+
+
+# =======================
+# COPY streaming
+# =======================
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_value(value):
+    """One field in COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea hex input; the backslash itself is escaped for COPY
+        return '\\\\x' + bytes(value).hex()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class CopyStream(io.RawIOBase):
+    """Readable file object over an iterator of COPY text rows, for copy_expert()"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = b''
+        self._offset = 0
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        size = len(target)
+        filled = 0
+        while filled < size:
+            if self._offset >= len(self._buffer):
+                row = next(self._rows, None)
+                if row is None:
+                    break
+                self._buffer = ('\t'.join(copy_value(value) for value in row) + '\n').encode('utf-8')
+                self._offset = 0
+                self.rows += 1
+            chunk = self._buffer[self._offset:self._offset + size - filled]
+            target[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+            self._offset += len(chunk)
+        return filled
+
+
+# =======================
+# Staging and upsert
+# =======================
+STAGING_SQL = """
+    CREATE TEMP TABLE import_products (
+        line              INTEGER,
+        external_ref      TEXT,
+        name              TEXT,
+        brand             TEXT,
+        category          TEXT,
+        description       TEXT,
+        base_price_cents  INTEGER,
+        weather_tag       TEXT,
+        style_tag         TEXT,
+        popularity_score  NUMERIC(4,2),
+        active            BOOLEAN,
+        image_data        BYTEA,
+        image_mime_type   TEXT,
+        image_hash        TEXT
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE import_sizes (
+        line           INTEGER,
+        product_ref    TEXT,
+        label          TEXT,
+        chest_cm       NUMERIC(6,2),
+        back_cm        NUMERIC(6,2),
+        neck_cm        NUMERIC(6,2),
+        weight_min_kg  NUMERIC(6,2),
+        weight_max_kg  NUMERIC(6,2),
+        sku            TEXT,
+        stock_qty      INTEGER
+    ) ON COMMIT DROP;
+"""
+
+# Last manifest row wins for a repeated external_ref. Unchanged rows are skipped,
+# so re-importing the same manifest writes nothing.
+UPSERT_PRODUCTS_SQL = """
+    INSERT INTO products (external_ref, name, brand, category, description, base_price_cents,
+                          weather_tag, style_tag, popularity_score, active,
+                          image_data, image_mime_type, image_hash)
+    SELECT DISTINCT ON (external_ref)
+           external_ref, name, brand, category, description, base_price_cents,
+           weather_tag, style_tag, COALESCE(popularity_score, 0.50), active,
+           image_data, image_mime_type, image_hash
+    FROM import_products
+    ORDER BY external_ref, line DESC
+    ON CONFLICT (external_ref) DO UPDATE SET
+        name = EXCLUDED.name,
+        brand = EXCLUDED.brand,
+        category = EXCLUDED.category,
+        description = EXCLUDED.description,
+        base_price_cents = EXCLUDED.base_price_cents,
+        weather_tag = EXCLUDED.weather_tag,
+        style_tag = EXCLUDED.style_tag,
+        active = EXCLUDED.active,
+        image_data = COALESCE(EXCLUDED.image_data, products.image_data),
+        image_mime_type = CASE WHEN EXCLUDED.image_data IS NULL THEN products.image_mime_type
+                               ELSE EXCLUDED.image_mime_type END,
+        image_hash = COALESCE(EXCLUDED.image_hash, products.image_hash)
+    WHERE (products.name, products.brand, products.category, products.description,
+           products.base_price_cents, products.weather_tag, products.style_tag, products.active)
+          IS DISTINCT FROM
+          (EXCLUDED.name, EXCLUDED.brand, EXCLUDED.category, EXCLUDED.description,
+           EXCLUDED.base_price_cents, EXCLUDED.weather_tag, EXCLUDED.style_tag, EXCLUDED.active)
+       OR EXCLUDED.image_data IS NOT NULL
+    RETURNING (xmax = 0) AS inserted
+"""
+
+UPSERT_SIZES_SQL = """
+    INSERT INTO product_sizes (product_id, label, chest_cm, back_cm, neck_cm,
+                               weight_min_kg, weight_max_kg, sku, stock_qty)
+    SELECT DISTINCT ON (p.id, s.label)
+           p.id, s.label, s.chest_cm, s.back_cm, s.neck_cm,
+           s.weight_min_kg, s.weight_max_kg, s.sku, s.stock_qty
+    FROM import_sizes s
+    JOIN products p ON p.external_ref = s.product_ref
+    ORDER BY p.id, s.label, s.line DESC
+    ON CONFLICT (product_id, label) DO UPDATE SET
+        chest_cm = EXCLUDED.chest_cm,
+        back_cm = EXCLUDED.back_cm,
+        neck_cm = EXCLUDED.neck_cm,
+        weight_min_kg = EXCLUDED.weight_min_kg,
+        weight_max_kg = EXCLUDED.weight_max_kg,
+        sku = EXCLUDED.sku,
+        stock_qty = EXCLUDED.stock_qty
+    WHERE (product_sizes.chest_cm, product_sizes.back_cm, product_sizes.neck_cm,
+           product_sizes.weight_min_kg, product_sizes.weight_max_kg,
+           product_sizes.sku, product_sizes.stock_qty)
+          IS DISTINCT FROM
+          (EXCLUDED.chest_cm, EXCLUDED.back_cm, EXCLUDED.neck_cm,
+           EXCLUDED.weight_min_kg, EXCLUDED.weight_max_kg, EXCLUDED.sku, EXCLUDED.stock_qty)
+    RETURNING (xmax = 0) AS inserted
+"""
+
+ORPHAN_SIZES_SQL = """
+    SELECT count(*) FROM import_sizes s
+    WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.external_ref = s.product_ref)
+"""
+
+
+class CatalogImport:
+    """One import run; counters and timings end up in summary()"""
+
+    def __init__(self, conn, products_path, sizes_path=None, image_dir=None,
+                 workers=IMPORT_WORKERS, dry_run=False, echo=print):
+        self.conn = conn
+        self.products_path = products_path
+        self.sizes_path = sizes_path
+        self.image_dir = image_dir
+        self.workers = max(1, workers)
+        self.dry_run = dry_run
+        self.echo = echo
+        self.errors = []
+        self.error_count = 0
+        self.inline_sizes = []
+        self.counts = {
+            'products_read': 0, 'products_inserted': 0, 'products_updated': 0,
+            'sizes_read': 0, 'sizes_inserted': 0, 'sizes_updated': 0, 'sizes_orphaned': 0,
+            'images_encoded': 0, 'images_unchanged': 0, 'images_failed': 0,
+        }
+        self.timings = {}
+
+    def _error(self, source, line, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS_SHOWN:
+            self.errors.append(f"{os.path.basename(source)}:{line}: {message}")
+
+    def _products(self):
+        for line, row in read_manifest(self.products_path):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                product = parse_product(row)
+                for size in row.get('sizes') or ():
+                    if not isinstance(size, dict):
+                        raise ManifestError("sizes must be a list of objects")
+                    self.inline_sizes.append((line, parse_size(size, product['external_ref'])))
+            except ManifestError as e:
+                self._error(self.products_path, line, e)
+                continue
+            product['line'] = line
+            yield product
+
+    def _known_image_hashes(self):
+        cur = self.conn.cursor()
+        try:
+            cur.execute("SELECT external_ref, image_hash FROM products "
+                        "WHERE external_ref IS NOT NULL AND image_hash IS NOT NULL")
+            return dict(cur.fetchall())
+        finally:
+            cur.close()
+
+    def _product_rows(self, executor, known_hashes):
+        """COPY rows for import_products, with images processed on the pool"""
+        # Images are processed ahead of the COPY by a bounded window of futures
+        window = deque()
+        for product in self._products():
+            future = None
+            if product['image'] and self.image_dir:
+                path = os.path.join(self.image_dir, product['image'])
+                future = executor.submit(process_image, path, known_hashes.get(product['external_ref']))
+            window.append((product, future))
+            if len(window) >= self.workers * 8:
+                yield self._product_row(*window.popleft())
+        while window:
+            yield self._product_row(*window.popleft())
+
+    def _product_row(self, product, future):
+        image_data = image_hash = mime_type = None
+        if future is not None:
+            image_hash, image_data, error = future.result()
+            if error:
+                self.counts['images_failed'] += 1
+                self._error(self.products_path, product['line'], error)
+            elif image_data is None:
+                self.counts['images_unchanged'] += 1
+            else:
+                self.counts['images_encoded'] += 1
+                mime_type = images.OUTPUT_MIME_TYPE
+        self.counts['products_read'] += 1
+        if self.counts['products_read'] % 10000 == 0:
+            self.echo(f">>> {self.counts['products_read']} products staged "
+                      f"({self.counts['products_read'] / (time.perf_counter() - self._started):.0f} rows/s)")
+        return (product['line'], product['external_ref'], product['name'], product['brand'],
+                product['category'], product['description'], product['base_price_cents'],
+                product['weather_tag'], product['style_tag'], product['popularity_score'],
+                product['active'], image_data, mime_type, image_hash)
+
+    def _size_rows(self):
+        for line, size in self.inline_sizes:
+            yield (line,) + tuple(size[field] for field in SIZE_FIELDS)
+        if not self.sizes_path:
+            return
+        for line, row in read_manifest(self.sizes_path):
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                size = parse_size(row)
+            except ManifestError as e:
+                self._error(self.sizes_path, line, e)
+                continue
+            yield (line,) + tuple(size[field] for field in SIZE_FIELDS)
+
+    def _timed(self, name, started):
+        self.timings[name] = time.perf_counter() - started
+
+    def run(self):
+        cur = self.conn.cursor()
+        self._started = time.perf_counter()
+        try:
+            cur.execute(STAGING_SQL)
+
+            # Read before the COPY starts: the connection can't run queries mid-COPY
+            known_hashes = self._known_image_hashes() if self.image_dir else {}
+
+            step = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                stream = CopyStream(self._product_rows(executor, known_hashes))
+                cur.copy_expert("COPY import_products FROM STDIN", stream, size=COPY_CHUNK_SIZE)
+            self._timed('stage_products', step)
+
+            step = time.perf_counter()
+            stream = CopyStream(self._size_rows())
+            cur.copy_expert("COPY import_sizes FROM STDIN", stream, size=COPY_CHUNK_SIZE)
+            self.counts['sizes_read'] = stream.rows
+            self._timed('stage_sizes', step)
+
+            step = time.perf_counter()
+            cur.execute(UPSERT_PRODUCTS_SQL)
+            inserted = [row[0] for row in cur.fetchall()]
+            self.counts['products_inserted'] = sum(inserted)
+            self.counts['products_updated'] = len(inserted) - sum(inserted)
+
+            cur.execute(UPSERT_SIZES_SQL)
+            inserted = [row[0] for row in cur.fetchall()]
+            self.counts['sizes_inserted'] = sum(inserted)
+            self.counts['sizes_updated'] = len(inserted) - sum(inserted)
+            cur.execute(ORPHAN_SIZES_SQL)
+            self.counts['sizes_orphaned'] = cur.fetchone()[0]
+            self._timed('upsert', step)
+
+            if self.dry_run:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+        except Exception:
+            if not self.conn.closed:
+                self.conn.rollback()
+            raise
+        finally:
+            cur.close()
+        self._timed('total', self._started)
+        return self.summary()
+
+    def summary(self):
+        total = self.timings.get('total') or 0.0
+        rows = self.counts['products_read'] + self.counts['sizes_read']
+        return {
+            **self.counts,
+            'rejected_rows': self.error_count,
+            'errors': self.errors,
+            'seconds': {name: round(value, 2) for name, value in self.timings.items()},
+            'rows_per_second': round(rows / total) if total else None,
+            'dry_run': self.dry_run,
+        }
@@ -0,0 +1,539 @@
+"""
+Database connection layer.
+
+Connections returned by get_db() in app.py use MonitoredConnection, which wraps
+every cursor (plain, RealDictCursor, named) so that statements slower than
+SLOW_QUERY_MS are recorded with normalized SQL, parameter shape, duration and
+the calling route. A sampled subset also gets an EXPLAIN (ANALYZE, BUFFERS)
+plan attached. Records go to an in-memory ring buffer and to a JSONL file.
+
+Connections are pooled per process and DSN; ReplicaSet hands out connections
+to health-checked read replicas for read-only work.
+"""
+import os
+import re
+import json
+import time
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import psycopg2
+import psycopg2.extensions
+
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get('SLOW_QUERY_BUFFER_SIZE', '200'))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', os.path.join('logs', 'slow_queries.jsonl'))
+
+slow_queries = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_log_lock = threading.Lock()
+
+
+# =======================
+# Slow-query recording
+# =======================
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query):
+    """Collapse whitespace and replace literals/placeholders with '?'"""
+    query = _STRING_LITERAL.sub('?', query)
+    query = _PLACEHOLDER.sub('?', query)
+    query = _NUMBER_LITERAL.sub('?', query)
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+def params_shape(params):
+    """Describe parameters by type only, never by value"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def _current_route():
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return None
+    if not has_request_context():
+        return None
+    return f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+
+
+def _explain(cursor, query, params):
+    """Run EXPLAIN (ANALYZE, BUFFERS) inside a savepoint so failures don't abort the transaction"""
+    conn = cursor.connection
+    # Constructed directly so the EXPLAIN itself is not monitored
+    raw = psycopg2.extensions.cursor(conn)
+    use_savepoint = not conn.autocommit
+    try:
+        if use_savepoint:
+            raw.execute("SAVEPOINT slow_query_explain")
+        raw.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+        plan = "\n".join(row[0] for row in raw.fetchall())
+        if use_savepoint:
+            raw.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    except Exception as e:
+        if use_savepoint:
+            try:
+                raw.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            except Exception:
+                pass
+        return f"EXPLAIN failed: {e}"
+    finally:
+        raw.close()
+
+
+def _write_jsonl(entry):
+    if not SLOW_QUERY_LOG:
+        return
+    try:
+        log_dir = os.path.dirname(SLOW_QUERY_LOG)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir, exist_ok=True)
+        with open(SLOW_QUERY_LOG, 'a') as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+    except OSError as e:
+        print(f">>> Slow-query log write error: {e}")
+
+
+def record_slow_query(cursor, query, params, duration_ms):
+    """Record a statement that exceeded SLOW_QUERY_MS"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        query = query.as_string(cursor.connection)
+
+    normalized = normalize_sql(query)
+    entry = {
+        'at': datetime.now(timezone.utc).isoformat(),
+        'duration_ms': round(duration_ms, 2),
+        'sql': normalized,
+        'params': params_shape(params),
+        'route': _current_route(),
+        'rowcount': cursor.rowcount,
+        'explain': None,
+    }
+
+    # EXPLAIN ANALYZE re-executes the statement, so only plain reads are sampled
+    is_read = normalized[:6].upper() == 'SELECT'
+    statement = _executed_statement(normalized)
+    if statement is not None:
+        entry['statement'] = statement.name
+        is_read = statement.is_read
+    if is_read and cursor.name is None and random.random() < SLOW_QUERY_EXPLAIN_RATE:
+        entry['explain'] = _explain(cursor, query, params)
+
+    with _log_lock:
+        slow_queries.append(entry)
+        _write_jsonl(entry)
+
+
+# =======================
+# Instrumented cursors and connections
+# =======================
+class MonitoredCursorMixin:
+    """Times execute()/executemany() and reports slow statements"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        result = super().execute(query, vars)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= SLOW_QUERY_MS:
+            record_slow_query(self, query, vars, duration_ms)
+        return result
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        result = super().executemany(query, vars_list)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= SLOW_QUERY_MS:
+            record_slow_query(self, query, None, duration_ms)
+        return result
+
+
+_monitored_classes = {}
+
+
+def monitored_cursor_class(cursor_class):
+    """Return (and cache) a subclass of cursor_class with slow-query timing"""
+    monitored = _monitored_classes.get(cursor_class)
+    if monitored is None:
+        monitored = type(f"Monitored{cursor_class.__name__}", (MonitoredCursorMixin, cursor_class), {})
+        _monitored_classes[cursor_class] = monitored
+    return monitored
+
+
+class MonitoredConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors all report slow queries"""
+
+    # Names of registry statements PREPAREd in this server session
+    prepared_statements = None
+
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = monitored_cursor_class(cursor_class)
+        return super().cursor(*args, **kwargs)
+
+
+# =======================
+# Prepared statements
+# =======================
+# Off when connecting through a transaction-mode pooler (e.g. PgBouncer), where
+# a PREPAREd name may not exist on the next transaction's server connection
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') == '1'
+
+_PARAMETER = re.compile(r"%\((\w+)\)s|%s|%%")
+_EXECUTE = re.compile(r"^EXECUTE (\w+)", re.IGNORECASE)
+
+statements = {}
+
+
+class Statement:
+    """
+    A named query from the registry. sql uses psycopg2 placeholders (all %s
+    or all %(name)s); text is the same query with $n parameters for PREPARE.
+    """
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.keys = []
+        positional = 0
+
+        def number(match):
+            nonlocal positional
+            if match.group(0) == '%%':
+                return '%'
+            key = match.group(1)
+            if key is None:
+                positional += 1
+                return f"${positional}"
+            if key not in self.keys:
+                self.keys.append(key)
+            return f"${self.keys.index(key) + 1}"
+
+        self.text = _PARAMETER.sub(number, sql)
+        if positional and self.keys:
+            raise ValueError(f"statement {name}: mixes %s and %(name)s placeholders")
+        self.param_count = positional or len(self.keys)
+        self.is_read = normalize_sql(sql)[:6].upper() in ('SELECT', 'WITH')
+
+    def arguments(self, params):
+        if self.keys:
+            return [params[key] for key in self.keys]
+        return list(params or ())
+
+
+def statement(name, sql):
+    """Register a query under a name; returns the Statement to pass to execute()"""
+    existing = statements.get(name)
+    if existing is not None and existing.sql != sql:
+        raise ValueError(f"statement {name} is already registered with different SQL")
+    statements[name] = existing or Statement(name, sql)
+    return statements[name]
+
+
+def _executed_statement(normalized):
+    match = _EXECUTE.match(normalized)
+    return statements.get(match.group(1)) if match else None
+
+
+def execute(cur, statement, params=None):
+    """
+    Run a registry statement. The first use on a connection PREPAREs it, so
+    later calls on that pooled connection skip parsing and reuse the plan
+    (Postgres switches to a cached generic plan once it is no worse than
+    custom ones). Named (server-side) cursors can't EXECUTE, so they and
+    connections outside the pool run the plain SQL.
+    """
+    conn = cur.connection
+    if not DB_PREPARED_STATEMENTS or cur.name is not None or not isinstance(conn, MonitoredConnection):
+        return cur.execute(statement.sql, params)
+
+    if conn.prepared_statements is None:
+        conn.prepared_statements = set()
+    if statement.name not in conn.prepared_statements:
+        # PREPARE is not transactional: the statement survives a later rollback
+        cur.execute(f"PREPARE {statement.name} AS {statement.text}")
+        conn.prepared_statements.add(statement.name)
+
+    if not statement.param_count:
+        return cur.execute(f"EXECUTE {statement.name}")
+    placeholders = ', '.join(['%s'] * statement.param_count)
+    return cur.execute(f"EXECUTE {statement.name} ({placeholders})", statement.arguments(params))
+
+
+# =======================
+# Connection pooling
+# =======================
+DB_POOL_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', '8'))
+DB_POOL_IDLE_SECONDS = float(os.environ.get('DB_POOL_IDLE_SECONDS', '240'))
+
+
+class PooledConnection(MonitoredConnection):
+    """Monitored connection whose close() hands it back to its pool"""
+
+    _pool = None
+    _released_at = 0.0
+
+    def close(self):
+        pool = self._pool
+        if pool is None:
+            return super().close()
+        pool.putconn(self)
+
+    def close_connection(self):
+        """Really close the underlying connection"""
+        self._pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Small per-process pool of idle connections for one DSN.
+    Connections are rolled back before reuse, and ones idle for longer than
+    DB_POOL_IDLE_SECONDS are dropped (Neon and most proxies close them
+    anyway). Connections inherited across fork() are discarded, never reused.
+    """
+
+    def __init__(self, dsn, max_idle=DB_POOL_MAX_IDLE, **connect_kwargs):
+        self.dsn = dsn
+        self.max_idle = max_idle
+        self.connect_kwargs = connect_kwargs
+        self.pid = os.getpid()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        if self.pid != os.getpid():
+            # Forked: the idle sockets belong to the parent, so just forget them
+            with self._lock:
+                self._idle = []
+                self.pid = os.getpid()
+
+    def getconn(self):
+        self._check_pid()
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                break
+            if conn.closed or now - conn._released_at > DB_POOL_IDLE_SECONDS:
+                conn.close_connection()
+                continue
+            conn._pool = self
+            return conn
+
+        conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection, **self.connect_kwargs)
+        conn._pool = self
+        return conn
+
+    def putconn(self, conn):
+        conn._pool = None
+        if conn.closed or self.pid != os.getpid():
+            return
+        try:
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            conn.close_connection()
+            return
+
+        conn._released_at = time.monotonic()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close_connection()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close_connection()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn, **connect_kwargs):
+    """Per-process pool for a DSN (connect_kwargs only apply when the pool is created)"""
+    pool = _pools.get(dsn)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(dsn)
+            if pool is None:
+                pool = _pools[dsn] = ConnectionPool(dsn, **connect_kwargs)
+    return pool
+
+
+def close_pools():
+    """Close every idle pooled connection (e.g. in a pre-fork master before forking)"""
+    for pool in list(_pools.values()):
+        pool.closeall()
+
+
+def reset_pools():
+    """Drop pools inherited from a parent process without touching their sockets"""
+    with _pools_lock:
+        _pools.clear()
+
+
+# =======================
+# Read replicas
+# =======================
+DB_REPLICA_CHECK_SECONDS = float(os.environ.get('DB_REPLICA_CHECK_SECONDS', '10'))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', '30'))
+DB_REPLICA_CONNECT_TIMEOUT = int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', '2'))
+
+# Zero lag when nothing is waiting to be replayed, so an idle primary doesn't
+# make a caught-up replica look stale. The lag is only meaningful in recovery;
+# ReplicaSet._check rejects servers that are not.
+REPLICA_HEALTH_SQL = """
+    SELECT pg_is_in_recovery(),
+           CASE WHEN NOT pg_is_in_recovery()
+                     OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+           END
+"""
+
+
+def parse_dsn_list(value):
+    """Comma-separated DSNs (e.g. DATABASE_REPLICA_URL) as a list"""
+    return [dsn.strip() for dsn in (value or '').split(',') if dsn.strip()]
+
+
+def _dsn_host(dsn):
+    """Host part of a DSN, for stats (never the credentials)"""
+    try:
+        return psycopg2.extensions.parse_dsn(dsn).get('host')
+    except psycopg2.ProgrammingError:
+        return None
+
+
+class Replica:
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.healthy = True
+        self.down_until = 0.0
+        self.checked_at = 0.0
+        self.lag_seconds = None
+        self.last_error = None
+        self.borrowed = 0
+        self.failures = 0
+
+
+class ReplicaSet:
+    """
+    Read-only connections spread round-robin over healthy replicas.
+    A replica is re-checked (reachable, in recovery, lag under
+    DB_REPLICA_MAX_LAG_SECONDS) on checkout at most every
+    DB_REPLICA_CHECK_SECONDS; one that fails is skipped for
+    DB_REPLICA_RETRY_SECONDS. getconn() returns None when no replica is
+    usable, and the caller falls back to the primary.
+    """
+
+    def __init__(self, dsns):
+        self.replicas = [Replica(dsn) for dsn in dsns]
+        self.fallbacks = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def _candidates(self):
+        now = time.monotonic()
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.replicas), 1)
+            ordered = self.replicas[start:] + self.replicas[:start]
+            for replica in ordered:
+                if not replica.healthy and now >= replica.down_until:
+                    # Retry window passed: give it another health check
+                    replica.healthy = True
+                    replica.checked_at = 0.0
+        return [replica for replica in ordered if replica.healthy]
+
+    def _mark_down(self, replica, reason):
+        with self._lock:
+            replica.healthy = False
+            replica.down_until = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+            replica.last_error = str(reason).strip()
+            replica.failures += 1
+        print(f">>> Replica unavailable, reads go elsewhere for {DB_REPLICA_RETRY_SECONDS:.0f}s: {replica.last_error}")
+
+    def _check(self, replica, conn):
+        # Constructed directly so the health check is not monitored
+        cur = psycopg2.extensions.cursor(conn)
+        try:
+            cur.execute(REPLICA_HEALTH_SQL)
+            in_recovery, lag = cur.fetchone()
+            conn.rollback()
+        except psycopg2.Error as e:
+            self._mark_down(replica, e)
+            return False
+        finally:
+            cur.close()
+
+        replica.checked_at = time.monotonic()
+        if not in_recovery:
+            # A primary (misconfigured, or a standby promoted by failover): its
+            # data may have diverged from ours, so never read from it
+            replica.lag_seconds = None
+            self._mark_down(replica, "not in recovery")
+            return False
+        lag = float(lag) if lag is not None else 0.0
+        replica.lag_seconds = round(lag, 3)
+        if lag > DB_REPLICA_MAX_LAG_SECONDS:
+            self._mark_down(replica, f"replication lag {lag:.1f}s")
+            return False
+        return True
+
+    def getconn(self):
+        """Pooled connection to a healthy replica, or None"""
+        for replica in self._candidates():
+            try:
+                conn = get_pool(replica.dsn, connect_timeout=DB_REPLICA_CONNECT_TIMEOUT).getconn()
+            except psycopg2.Error as e:
+                self._mark_down(replica, e)
+                continue
+            if time.monotonic() - replica.checked_at >= DB_REPLICA_CHECK_SECONDS:
+                if not self._check(replica, conn):
+                    conn.close_connection()
+                    continue
+            with self._lock:
+                replica.borrowed += 1
+            return conn
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'fallbacks_to_primary': self.fallbacks,
+                'replicas': [{
+                    'host': _dsn_host(replica.dsn),
+                    'healthy': replica.healthy,
+                    'lag_seconds': replica.lag_seconds,
+                    'borrowed': replica.borrowed,
+                    'failures': replica.failures,
+                    'last_error': replica.last_error,
+                } for replica in self.replicas],
+            }
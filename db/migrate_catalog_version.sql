@@ -0,0 +1,36 @@
+-- Catalog version counter
+-- Bumped by statement-level triggers whenever product_sizes or the product
+-- columns the snapshot and facets read change, so app workers can cheaply
+-- tell whether their in-process catalog snapshot is stale.
+-- popularity_score is left out: it changes on every popularity pass and has
+-- its own popularity_version.
+
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id          BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version     BIGINT NOT NULL DEFAULT 1,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO catalog_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+-- Bumped by jobs.update_popularity when it changes popularity_score, which
+-- the version triggers ignore: snapshots refresh that one column instead of
+-- reloading the catalog
+ALTER TABLE catalog_version ADD COLUMN IF NOT EXISTS popularity_version BIGINT NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE catalog_version SET version = version + 1, updated_at = now();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_bump_catalog_version ON products;
+CREATE TRIGGER products_bump_catalog_version
+    AFTER INSERT OR DELETE OR TRUNCATE
+          OR UPDATE OF id, category, base_price_cents, weather_tag, style_tag, active ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+DROP TRIGGER IF EXISTS product_sizes_bump_catalog_version ON product_sizes;
+CREATE TRIGGER product_sizes_bump_catalog_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON product_sizes
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
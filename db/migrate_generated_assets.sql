@@ -0,0 +1,20 @@
+-- Generated asset index
+-- One row per content-addressed file written by asset_store.py (Gemini try-on
+-- results). last_accessed_at drives LRU eviction when the store is over quota;
+-- cache_key lets callers reuse an earlier result for the same inputs.
+
+CREATE TABLE IF NOT EXISTS generated_assets (
+    content_hash      TEXT PRIMARY KEY,          -- sha256 hex of the file bytes
+    storage_key       TEXT NOT NULL UNIQUE,      -- ab/cd/<hash>.<ext>
+    content_type      TEXT NOT NULL,
+    size_bytes        BIGINT NOT NULL,
+    owner_user_id     BIGINT REFERENCES users(id) ON DELETE SET NULL,
+    product_id        BIGINT REFERENCES products(id) ON DELETE SET NULL,
+    pet_id            BIGINT REFERENCES pets(id) ON DELETE SET NULL,
+    cache_key         TEXT,
+    created_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_accessed_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_generated_assets_last_accessed ON generated_assets(last_accessed_at);
+CREATE INDEX IF NOT EXISTS idx_generated_assets_cache_key ON generated_assets(cache_key) WHERE cache_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_generated_assets_owner ON generated_assets(owner_user_id);
@@ -0,0 +1,134 @@
+-- Monthly partitioning for recommendation_logs, plus daily rollups
+-- recommendation_logs becomes RANGE-partitioned on created_at, one partition
+-- per UTC month (recommendation_logs_pYYYYMM), so retention is a DROP TABLE
+-- instead of a DELETE. Analytics read recommendation_daily_rollups.
+-- Partitions ahead of time are created by the app's background scheduler
+-- (jobs.py) and by `flask reco-maintenance`, which also maintains the rollups.
+--
+-- Run once; safe to re-run (skips the conversion if already partitioned).
+
+-- Creates the default partition and any missing monthly partitions between
+-- two months (inclusive). Rows already in the default partition for a month
+-- being created are moved into it.
+CREATE OR REPLACE FUNCTION ensure_recommendation_log_partitions(from_month DATE, to_month DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    month DATE := date_trunc('month', from_month)::date;
+    created INTEGER := 0;
+    partition_name TEXT;
+    month_start TIMESTAMPTZ;
+    month_end TIMESTAMPTZ;
+    stranded BOOLEAN;
+    moved_rows BIGINT;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('recommendation_logs')
+    ) THEN
+        RAISE NOTICE 'recommendation_logs is not partitioned; run migrate_partition_recommendation_logs.sql';
+        RETURN 0;
+    END IF;
+    -- Workers run this concurrently (the jobs scheduler); one at a time
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_recommendation_log_partitions'));
+    -- Catches rows outside every monthly partition
+    IF to_regclass('recommendation_logs_default') IS NULL THEN
+        CREATE TABLE recommendation_logs_default PARTITION OF recommendation_logs DEFAULT;
+    END IF;
+
+    WHILE month <= to_month LOOP
+        partition_name := 'recommendation_logs_p' || to_char(month, 'YYYYMM');
+        month_start := month::timestamp AT TIME ZONE 'UTC';
+        month_end := (month + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC';
+        IF to_regclass(partition_name) IS NULL THEN
+            -- Rows that landed in the default partition for this month would make
+            -- CREATE ... PARTITION OF fail: move them into the new partition
+            SELECT EXISTS (
+                SELECT 1 FROM recommendation_logs_default
+                WHERE created_at >= month_start AND created_at < month_end
+            ) INTO stranded;
+            IF stranded THEN
+                ALTER TABLE recommendation_logs DETACH PARTITION recommendation_logs_default;
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF recommendation_logs FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_end
+            );
+            IF stranded THEN
+                WITH moved AS (
+                    DELETE FROM recommendation_logs_default
+                    WHERE created_at >= month_start AND created_at < month_end
+                    RETURNING *
+                )
+                INSERT INTO recommendation_logs SELECT * FROM moved;
+                GET DIAGNOSTICS moved_rows = ROW_COUNT;
+                ALTER TABLE recommendation_logs ATTACH PARTITION recommendation_logs_default DEFAULT;
+                RAISE NOTICE 'moved % rows from recommendation_logs_default into %', moved_rows, partition_name;
+            END IF;
+            created := created + 1;
+        END IF;
+        month := (month + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    oldest TIMESTAMPTZ;
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('recommendation_logs')
+    ) THEN
+        RAISE NOTICE 'recommendation_logs is already partitioned';
+        RETURN;
+    END IF;
+
+    ALTER TABLE recommendation_logs RENAME TO recommendation_logs_unpartitioned;
+    ALTER INDEX IF EXISTS idx_reco_logs_user_pet RENAME TO idx_reco_logs_unpartitioned_user_pet;
+
+    CREATE TABLE recommendation_logs (
+        id               BIGINT NOT NULL DEFAULT nextval('recommendation_logs_id_seq'),
+        user_id          BIGINT REFERENCES users(id) ON DELETE SET NULL,
+        pet_id           BIGINT REFERENCES pets(id) ON DELETE SET NULL,
+        product_id       BIGINT REFERENCES products(id) ON DELETE SET NULL,
+        product_size_id  BIGINT REFERENCES product_sizes(id) ON DELETE SET NULL,
+        score_total      NUMERIC(4,2),
+        score_fit        NUMERIC(4,2),
+        score_weather    NUMERIC(4,2),
+        score_style      NUMERIC(4,2),
+        score_price      NUMERIC(4,2),
+        score_popularity NUMERIC(4,2),
+        created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    CREATE INDEX idx_reco_logs_user_pet ON recommendation_logs(user_id, pet_id);
+    CREATE INDEX idx_reco_logs_created_at ON recommendation_logs(created_at);
+
+    SELECT min(created_at) INTO oldest FROM recommendation_logs_unpartitioned;
+    PERFORM ensure_recommendation_log_partitions(
+        COALESCE((oldest AT TIME ZONE 'UTC')::date, (now() AT TIME ZONE 'UTC')::date),
+        ((now() AT TIME ZONE 'UTC') + INTERVAL '3 months')::date
+    );
+
+    INSERT INTO recommendation_logs SELECT * FROM recommendation_logs_unpartitioned;
+    ALTER SEQUENCE recommendation_logs_id_seq OWNED BY recommendation_logs.id;
+    DROP TABLE recommendation_logs_unpartitioned;
+END;
+$$;
+
+-- Per-day impressions and average scores per recommended product size (UTC days)
+CREATE TABLE IF NOT EXISTS recommendation_daily_rollups (
+    day                    DATE NOT NULL,
+    product_id             BIGINT NOT NULL,
+    product_size_id        BIGINT NOT NULL,
+    impressions            INTEGER NOT NULL,
+    distinct_pets          INTEGER NOT NULL,
+    avg_score_total        NUMERIC(6,4),
+    avg_score_fit          NUMERIC(6,4),
+    avg_score_weather      NUMERIC(6,4),
+    avg_score_style        NUMERIC(6,4),
+    avg_score_price        NUMERIC(6,4),
+    avg_score_popularity   NUMERIC(6,4),
+    rolled_up_at           TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (day, product_id, product_size_id)
+);
+CREATE INDEX IF NOT EXISTS idx_reco_rollups_product_day ON recommendation_daily_rollups(product_id, day);
@@ -0,0 +1,57 @@
+-- Persisted pet feature vectors
+-- pets.feature_vector holds what the recommenders score against, in
+-- pet_features.FEATURES order:
+--   {chest_cm, back_cm, neck_cm, weight_kg, weather code, style code}
+-- (dimensions estimated from the breed averages scaled by weight). The app
+-- writes it together with the pet (pet_features.refresh_pets); these
+-- triggers reset it to NULL whenever its inputs change by any other path, and
+-- pet_features.refresh_stale() (scheduler / `flask pet-features`) recomputes
+-- NULL vectors.
+
+ALTER TABLE pets ADD COLUMN IF NOT EXISTS feature_vector DOUBLE PRECISION[];
+CREATE INDEX IF NOT EXISTS idx_pets_feature_vector_stale ON pets(id) WHERE feature_vector IS NULL;
+
+-- Breed, weight or preferences changed without a new vector in the same UPDATE
+CREATE OR REPLACE FUNCTION reset_pet_feature_vector() RETURNS trigger AS $$
+BEGIN
+    IF NEW.feature_vector IS NOT DISTINCT FROM OLD.feature_vector THEN
+        NEW.feature_vector := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pets_reset_feature_vector ON pets;
+CREATE TRIGGER pets_reset_feature_vector
+    BEFORE UPDATE OF breed_id, weight_kg, weather_preference, style_preference ON pets
+    FOR EACH ROW
+    WHEN ((OLD.breed_id, OLD.weight_kg, OLD.weather_preference, OLD.style_preference)
+          IS DISTINCT FROM (NEW.breed_id, NEW.weight_kg, NEW.weather_preference, NEW.style_preference))
+    EXECUTE FUNCTION reset_pet_feature_vector();
+
+-- Breed averages changed: every pet of that breed needs new estimates
+CREATE OR REPLACE FUNCTION reset_breed_pet_features() RETURNS trigger AS $$
+BEGIN
+    UPDATE pets SET feature_vector = NULL
+    WHERE breed_id = NEW.id AND feature_vector IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS breeds_reset_pet_features ON breeds;
+CREATE TRIGGER breeds_reset_pet_features
+    AFTER UPDATE OF avg_weight_kg, avg_chest_cm, avg_back_cm, avg_neck_cm ON breeds
+    FOR EACH ROW
+    WHEN ((OLD.avg_weight_kg, OLD.avg_chest_cm, OLD.avg_back_cm, OLD.avg_neck_cm)
+          IS DISTINCT FROM (NEW.avg_weight_kg, NEW.avg_chest_cm, NEW.avg_back_cm, NEW.avg_neck_cm))
+    EXECUTE FUNCTION reset_breed_pet_features();
+
+-- Preferences outside pet_features' vocabularies used to encode as "no
+-- preference"; reset those vectors so they are recomputed with the unknown
+-- code (pet_features.UNKNOWN_CODE = -1), which scores like the raw value
+UPDATE pets SET feature_vector = NULL
+WHERE feature_vector IS NOT NULL
+  AND ((weather_preference <> '' AND weather_preference NOT IN ('all-season', 'cold', 'warm', 'rain')
+        AND feature_vector[5] <> -1)
+    OR (style_preference <> '' AND style_preference NOT IN ('any', 'classic', 'sport', 'street')
+        AND feature_vector[6] <> -1));
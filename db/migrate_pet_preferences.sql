@@ -0,0 +1,9 @@
+-- Pet columns the app reads and writes but the original schema lacked
+-- (add_pet/update_pet store weather_preference/style_preference; the
+-- measurement fields are shown on My Page).
+
+ALTER TABLE pets ADD COLUMN IF NOT EXISTS weather_preference TEXT;
+ALTER TABLE pets ADD COLUMN IF NOT EXISTS style_preference TEXT;
+ALTER TABLE pets ADD COLUMN IF NOT EXISTS neck_cm NUMERIC(6,2);
+ALTER TABLE pets ADD COLUMN IF NOT EXISTS chest_cm NUMERIC(6,2);
+ALTER TABLE pets ADD COLUMN IF NOT EXISTS back_cm NUMERIC(6,2);
@@ -0,0 +1,34 @@
+-- Popularity pipeline
+-- cart_events records add-to-cart actions (the cart itself lives in the
+-- session). product_popularity holds a time-decayed event weight per product,
+-- folded forward incrementally by jobs.update_popularity from the positions
+-- stored in job_watermarks; products.popularity_score is derived from it.
+
+CREATE TABLE IF NOT EXISTS cart_events (
+    id          BIGSERIAL PRIMARY KEY,
+    user_id     BIGINT REFERENCES users(id) ON DELETE SET NULL,
+    product_id  BIGINT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    size_label  TEXT,
+    qty         INTEGER NOT NULL DEFAULT 1,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_cart_events_product_id ON cart_events(product_id);
+
+-- Last processed id per incremental job and source table
+CREATE TABLE IF NOT EXISTS job_watermarks (
+    job         TEXT PRIMARY KEY,
+    last_id     BIGINT NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+-- Ids below last_id that were not committed yet when the watermark passed
+-- them ({"id": first seen, epoch seconds}); re-read until they appear or expire
+ALTER TABLE job_watermarks ADD COLUMN IF NOT EXISTS gaps JSONB NOT NULL DEFAULT '{}';
+
+CREATE TABLE IF NOT EXISTS product_popularity (
+    product_id       BIGINT PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    decayed_weight   DOUBLE PRECISION NOT NULL DEFAULT 0,  -- as of decayed_at
+    decayed_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+    recommendations  BIGINT NOT NULL DEFAULT 0,            -- lifetime counts
+    cart_adds        BIGINT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_product_popularity_decayed_at ON product_popularity(decayed_at);
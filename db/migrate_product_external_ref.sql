@@ -0,0 +1,8 @@
+-- Stable manifest ids for bulk catalog imports (`flask import-catalog`)
+-- external_ref is what re-imports upsert on; image_hash is the sha256 of the
+-- source image file, so unchanged images are not re-encoded or rewritten.
+-- Products added by the Naver fetch or by hand keep external_ref NULL.
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS external_ref TEXT;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS image_hash TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_external_ref ON products(external_ref);
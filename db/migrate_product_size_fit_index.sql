@@ -0,0 +1,19 @@
+-- "Fits my pet" listing filter (index() with ?fits_pet=<pet id>)
+-- A size fits when its chest/back point lies in the pet's tolerance box and
+-- its weight band overlaps the pet's weight +/- tolerance. One GiST index
+-- answers both: box_ops on the measurements, range_ops on the band.
+-- A missing bound leaves the band open on that side (like the scorer);
+-- inverted bands (min > max, bad imports) are empty and never match.
+
+CREATE OR REPLACE FUNCTION product_size_weight_band(weight_min_kg NUMERIC, weight_max_kg NUMERIC)
+RETURNS numrange AS $$
+    SELECT CASE
+               WHEN weight_min_kg > weight_max_kg THEN 'empty'::numrange
+               ELSE numrange(weight_min_kg, weight_max_kg, '[]')
+           END
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX IF NOT EXISTS idx_product_sizes_fit ON product_sizes USING gist (
+    box(point(chest_cm::float8, back_cm::float8), point(chest_cm::float8, back_cm::float8)),
+    product_size_weight_band(weight_min_kg, weight_max_kg)
+);
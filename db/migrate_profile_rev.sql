@@ -0,0 +1,40 @@
+-- Per-user profile revision
+-- users.profile_rev is bumped in the same transaction as any change to a
+-- user's pets or account summary (by whichever process, device or job made
+-- it), so app workers can tell whether their cached profile
+-- (app.ProfileCache: user summary + pets) is stale.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_rev BIGINT NOT NULL DEFAULT 1;
+
+-- Pet added, changed (including its photo and feature vector) or removed
+CREATE OR REPLACE FUNCTION bump_pet_owner_profile_rev() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE users SET profile_rev = profile_rev + 1 WHERE id = OLD.user_id;
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id) THEN
+        UPDATE users SET profile_rev = profile_rev + 1 WHERE id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pets_bump_profile_rev ON pets;
+CREATE TRIGGER pets_bump_profile_rev
+    AFTER INSERT OR UPDATE OR DELETE ON pets
+    FOR EACH ROW EXECUTE FUNCTION bump_pet_owner_profile_rev();
+
+-- Username or email (the cached user summary) changed
+CREATE OR REPLACE FUNCTION bump_user_profile_rev() RETURNS trigger AS $$
+BEGIN
+    NEW.profile_rev := OLD.profile_rev + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_bump_profile_rev ON users;
+CREATE TRIGGER users_bump_profile_rev
+    BEFORE UPDATE OF username, email ON users
+    FOR EACH ROW
+    WHEN ((OLD.username, OLD.email) IS DISTINCT FROM (NEW.username, NEW.email))
+    EXECUTE FUNCTION bump_user_profile_rev();
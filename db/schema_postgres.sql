@@ -7,6 +7,7 @@ CREATE TABLE IF NOT EXISTS users (
     username        TEXT NOT NULL UNIQUE,
     email           TEXT UNIQUE,
     password_hash   TEXT NOT NULL,
+    profile_rev     BIGINT NOT NULL DEFAULT 1,  -- see migrate_profile_rev.sql
     created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
 );
 
@@ -34,10 +35,87 @@ CREATE TABLE IF NOT EXISTS pets (
     price_range     TEXT CHECK (price_range IN ('budget','mid','premium')),
     image_data      BYTEA,
     image_mime_type TEXT,
-    created_at      TIMESTAMPTZ NOT NULL DEFAULT now()
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT now(),
+    weather_preference TEXT,
+    style_preference   TEXT,
+    neck_cm         NUMERIC(6,2),
+    chest_cm        NUMERIC(6,2),
+    back_cm         NUMERIC(6,2),
+    feature_vector  DOUBLE PRECISION[]  -- see migrate_pet_features.sql
 );
 CREATE INDEX IF NOT EXISTS idx_pets_user_id ON pets(user_id);
 CREATE INDEX IF NOT EXISTS idx_pets_breed_id ON pets(breed_id);
+CREATE INDEX IF NOT EXISTS idx_pets_feature_vector_stale ON pets(id) WHERE feature_vector IS NULL;
+
+-- Pet feature vector maintenance (see migrate_pet_features.sql)
+-- Breed, weight or preferences changed without a new vector in the same UPDATE
+CREATE OR REPLACE FUNCTION reset_pet_feature_vector() RETURNS trigger AS $$
+BEGIN
+    IF NEW.feature_vector IS NOT DISTINCT FROM OLD.feature_vector THEN
+        NEW.feature_vector := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pets_reset_feature_vector ON pets;
+CREATE TRIGGER pets_reset_feature_vector
+    BEFORE UPDATE OF breed_id, weight_kg, weather_preference, style_preference ON pets
+    FOR EACH ROW
+    WHEN ((OLD.breed_id, OLD.weight_kg, OLD.weather_preference, OLD.style_preference)
+          IS DISTINCT FROM (NEW.breed_id, NEW.weight_kg, NEW.weather_preference, NEW.style_preference))
+    EXECUTE FUNCTION reset_pet_feature_vector();
+
+-- Breed averages changed: every pet of that breed needs new estimates
+CREATE OR REPLACE FUNCTION reset_breed_pet_features() RETURNS trigger AS $$
+BEGIN
+    UPDATE pets SET feature_vector = NULL
+    WHERE breed_id = NEW.id AND feature_vector IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS breeds_reset_pet_features ON breeds;
+CREATE TRIGGER breeds_reset_pet_features
+    AFTER UPDATE OF avg_weight_kg, avg_chest_cm, avg_back_cm, avg_neck_cm ON breeds
+    FOR EACH ROW
+    WHEN ((OLD.avg_weight_kg, OLD.avg_chest_cm, OLD.avg_back_cm, OLD.avg_neck_cm)
+          IS DISTINCT FROM (NEW.avg_weight_kg, NEW.avg_chest_cm, NEW.avg_back_cm, NEW.avg_neck_cm))
+    EXECUTE FUNCTION reset_breed_pet_features();
+
+-- Profile revision (see migrate_profile_rev.sql)
+-- Pet added, changed (including its photo and feature vector) or removed
+CREATE OR REPLACE FUNCTION bump_pet_owner_profile_rev() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE users SET profile_rev = profile_rev + 1 WHERE id = OLD.user_id;
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id) THEN
+        UPDATE users SET profile_rev = profile_rev + 1 WHERE id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pets_bump_profile_rev ON pets;
+CREATE TRIGGER pets_bump_profile_rev
+    AFTER INSERT OR UPDATE OR DELETE ON pets
+    FOR EACH ROW EXECUTE FUNCTION bump_pet_owner_profile_rev();
+
+-- Username or email (the cached user summary) changed
+CREATE OR REPLACE FUNCTION bump_user_profile_rev() RETURNS trigger AS $$
+BEGIN
+    NEW.profile_rev := OLD.profile_rev + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_bump_profile_rev ON users;
+CREATE TRIGGER users_bump_profile_rev
+    BEFORE UPDATE OF username, email ON users
+    FOR EACH ROW
+    WHEN ((OLD.username, OLD.email) IS DISTINCT FROM (NEW.username, NEW.email))
+    EXECUTE FUNCTION bump_user_profile_rev();
 
 -- Products
 CREATE TABLE IF NOT EXISTS products (
@@ -53,10 +131,13 @@ CREATE TABLE IF NOT EXISTS products (
     image_data        BYTEA,
     image_mime_type   TEXT,
     active            BOOLEAN NOT NULL DEFAULT TRUE,
-    created_at        TIMESTAMPTZ NOT NULL DEFAULT now()
+    created_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+    external_ref      TEXT,  -- manifest id for bulk imports (see migrate_product_external_ref.sql)
+    image_hash        TEXT   -- sha256 of the imported source image
 );
 CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
 CREATE INDEX IF NOT EXISTS idx_products_active ON products(active);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_external_ref ON products(external_ref);
 
 -- Product sizes/dimensions (multiple sizes per product)
 CREATE TABLE IF NOT EXISTS product_sizes (
@@ -74,9 +155,69 @@ CREATE TABLE IF NOT EXISTS product_sizes (
 );
 CREATE INDEX IF NOT EXISTS idx_product_sizes_product_id ON product_sizes(product_id);
 
+-- Size fit index for the "fits my pet" listing filter (see migrate_product_size_fit_index.sql)
+CREATE OR REPLACE FUNCTION product_size_weight_band(weight_min_kg NUMERIC, weight_max_kg NUMERIC)
+RETURNS numrange AS $$
+    SELECT CASE
+               WHEN weight_min_kg > weight_max_kg THEN 'empty'::numrange
+               ELSE numrange(weight_min_kg, weight_max_kg, '[]')
+           END
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX IF NOT EXISTS idx_product_sizes_fit ON product_sizes USING gist (
+    box(point(chest_cm::float8, back_cm::float8), point(chest_cm::float8, back_cm::float8)),
+    product_size_weight_band(weight_min_kg, weight_max_kg)
+);
+
+-- Catalog version counter (see migrate_catalog_version.sql)
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id          BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version     BIGINT NOT NULL DEFAULT 1,
+    popularity_version BIGINT NOT NULL DEFAULT 1,  -- popularity_score changes (not in version)
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO catalog_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE catalog_version SET version = version + 1, updated_at = now();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_bump_catalog_version ON products;
+CREATE TRIGGER products_bump_catalog_version
+    AFTER INSERT OR DELETE OR TRUNCATE
+          OR UPDATE OF id, category, base_price_cents, weather_tag, style_tag, active ON products
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+DROP TRIGGER IF EXISTS product_sizes_bump_catalog_version ON product_sizes;
+CREATE TRIGGER product_sizes_bump_catalog_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON product_sizes
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+-- Generated try-on images (see migrate_generated_assets.sql)
+CREATE TABLE IF NOT EXISTS generated_assets (
+    content_hash      TEXT PRIMARY KEY,          -- sha256 hex of the file bytes
+    storage_key       TEXT NOT NULL UNIQUE,      -- ab/cd/<hash>.<ext>
+    content_type      TEXT NOT NULL,
+    size_bytes        BIGINT NOT NULL,
+    owner_user_id     BIGINT REFERENCES users(id) ON DELETE SET NULL,
+    product_id        BIGINT REFERENCES products(id) ON DELETE SET NULL,
+    pet_id            BIGINT REFERENCES pets(id) ON DELETE SET NULL,
+    cache_key         TEXT,
+    created_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_accessed_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_generated_assets_last_accessed ON generated_assets(last_accessed_at);
+CREATE INDEX IF NOT EXISTS idx_generated_assets_cache_key ON generated_assets(cache_key) WHERE cache_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_generated_assets_owner ON generated_assets(owner_user_id);
+
 -- Optional logging for recommendations
+-- Partitioned by UTC month (see migrate_partition_recommendation_logs.sql);
+-- old months are dropped and summarized in recommendation_daily_rollups.
 CREATE TABLE IF NOT EXISTS recommendation_logs (
-    id               BIGSERIAL PRIMARY KEY,
+    id               BIGSERIAL,
     user_id          BIGINT REFERENCES users(id) ON DELETE SET NULL,
     pet_id           BIGINT REFERENCES pets(id) ON DELETE SET NULL,
     product_id       BIGINT REFERENCES products(id) ON DELETE SET NULL,
@@ -87,9 +228,123 @@ CREATE TABLE IF NOT EXISTS recommendation_logs (
     score_style      NUMERIC(4,2),
     score_price      NUMERIC(4,2),
     score_popularity NUMERIC(4,2),
-    created_at       TIMESTAMPTZ NOT NULL DEFAULT now()
-);
+    created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
 CREATE INDEX IF NOT EXISTS idx_reco_logs_user_pet ON recommendation_logs(user_id, pet_id);
+CREATE INDEX IF NOT EXISTS idx_reco_logs_created_at ON recommendation_logs(created_at);
+
+CREATE OR REPLACE FUNCTION ensure_recommendation_log_partitions(from_month DATE, to_month DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    month DATE := date_trunc('month', from_month)::date;
+    created INTEGER := 0;
+    partition_name TEXT;
+    month_start TIMESTAMPTZ;
+    month_end TIMESTAMPTZ;
+    stranded BOOLEAN;
+    moved_rows BIGINT;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('recommendation_logs')
+    ) THEN
+        RAISE NOTICE 'recommendation_logs is not partitioned; run migrate_partition_recommendation_logs.sql';
+        RETURN 0;
+    END IF;
+    -- Workers run this concurrently (the jobs scheduler); one at a time
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_recommendation_log_partitions'));
+    -- Catches rows outside every monthly partition
+    IF to_regclass('recommendation_logs_default') IS NULL THEN
+        CREATE TABLE recommendation_logs_default PARTITION OF recommendation_logs DEFAULT;
+    END IF;
+
+    WHILE month <= to_month LOOP
+        partition_name := 'recommendation_logs_p' || to_char(month, 'YYYYMM');
+        month_start := month::timestamp AT TIME ZONE 'UTC';
+        month_end := (month + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC';
+        IF to_regclass(partition_name) IS NULL THEN
+            -- Rows that landed in the default partition for this month would make
+            -- CREATE ... PARTITION OF fail: move them into the new partition
+            SELECT EXISTS (
+                SELECT 1 FROM recommendation_logs_default
+                WHERE created_at >= month_start AND created_at < month_end
+            ) INTO stranded;
+            IF stranded THEN
+                ALTER TABLE recommendation_logs DETACH PARTITION recommendation_logs_default;
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF recommendation_logs FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_end
+            );
+            IF stranded THEN
+                WITH moved AS (
+                    DELETE FROM recommendation_logs_default
+                    WHERE created_at >= month_start AND created_at < month_end
+                    RETURNING *
+                )
+                INSERT INTO recommendation_logs SELECT * FROM moved;
+                GET DIAGNOSTICS moved_rows = ROW_COUNT;
+                ALTER TABLE recommendation_logs ATTACH PARTITION recommendation_logs_default DEFAULT;
+                RAISE NOTICE 'moved % rows from recommendation_logs_default into %', moved_rows, partition_name;
+            END IF;
+            created := created + 1;
+        END IF;
+        month := (month + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_recommendation_log_partitions(
+    (now() AT TIME ZONE 'UTC')::date,
+    ((now() AT TIME ZONE 'UTC') + INTERVAL '3 months')::date
+);
+
+-- Per-day impressions and average scores per recommended product size (UTC days)
+CREATE TABLE IF NOT EXISTS recommendation_daily_rollups (
+    day                    DATE NOT NULL,
+    product_id             BIGINT NOT NULL,
+    product_size_id        BIGINT NOT NULL,
+    impressions            INTEGER NOT NULL,
+    distinct_pets          INTEGER NOT NULL,
+    avg_score_total        NUMERIC(6,4),
+    avg_score_fit          NUMERIC(6,4),
+    avg_score_weather      NUMERIC(6,4),
+    avg_score_style        NUMERIC(6,4),
+    avg_score_price        NUMERIC(6,4),
+    avg_score_popularity   NUMERIC(6,4),
+    rolled_up_at           TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (day, product_id, product_size_id)
+);
+CREATE INDEX IF NOT EXISTS idx_reco_rollups_product_day ON recommendation_daily_rollups(product_id, day);
+
+-- Popularity pipeline (see migrate_popularity.sql)
+CREATE TABLE IF NOT EXISTS cart_events (
+    id          BIGSERIAL PRIMARY KEY,
+    user_id     BIGINT REFERENCES users(id) ON DELETE SET NULL,
+    product_id  BIGINT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    size_label  TEXT,
+    qty         INTEGER NOT NULL DEFAULT 1,
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_cart_events_product_id ON cart_events(product_id);
+
+-- Last processed id per incremental job and source table
+CREATE TABLE IF NOT EXISTS job_watermarks (
+    job         TEXT PRIMARY KEY,
+    last_id     BIGINT NOT NULL DEFAULT 0,
+    gaps        JSONB NOT NULL DEFAULT '{}',  -- skipped ids still to re-read (see migrate_popularity.sql)
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS product_popularity (
+    product_id       BIGINT PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    decayed_weight   DOUBLE PRECISION NOT NULL DEFAULT 0,  -- as of decayed_at
+    decayed_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+    recommendations  BIGINT NOT NULL DEFAULT 0,            -- lifetime counts
+    cart_adds        BIGINT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_product_popularity_decayed_at ON product_popularity(decayed_at);
 
 -- Sample lookup data for breeds (extend as needed)
 INSERT INTO breeds (name, avg_weight_kg, avg_chest_cm, avg_back_cm, avg_neck_cm, size_label)
@@ -0,0 +1,247 @@
+"""
+Listing facets: product counts per category, price bucket, weather tag and
+style tag for the current listing query.
+
+Counts are disjunctive: each dimension is counted with every filter applied
+except its own, so with weather=cold selected the weather facet still shows
+how many products each other weather would give, while category, price and
+style only count cold products.
+
+Two sources:
+  - filtered listings (search, fits_pet, price/weather/style) get their
+    counts from facet_counts_sql(), a scalar subquery the listing statement
+    carries as a column: one grouped pass (GROUPING SETS) in the same round
+    trip as the page
+  - the unfiltered listing, with or without a category, reads FacetCache:
+    the whole catalog's counts, broken down by category as well, computed
+    once per catalog_version (bumped by triggers on products/product_sizes)
+    and re-checked at most every CATALOG_VERSION_CHECK_SECONDS
+"""
+import os
+import json
+import time
+import threading
+
+import db
+import catalog
+
+
+# Upper bounds (cents, exclusive) of the price buckets; bucket n is
+# [FACET_PRICE_BOUNDS[n-1], FACET_PRICE_BOUNDS[n]), the last one open-ended
+FACET_PRICE_BOUNDS = tuple(
+    int(bound) for bound in os.environ.get('FACET_PRICE_BOUNDS', '2000,5000,10000,15000').split(',')
+)
+
+DIMENSIONS = ('category', 'price', 'weather', 'style')
+
+PRICE_BUCKET_SQL = f"width_bucket(p.base_price_cents, ARRAY[{', '.join(map(str, FACET_PRICE_BOUNDS))}])"
+
+DIMENSION_COLUMNS = {
+    'category': "p.category",
+    'price': PRICE_BUCKET_SQL,
+    'weather': "p.weather_tag",
+    'style': "p.style_tag",
+}
+
+# Listing filters on the price/weather/style facets. Unlike category (one
+# statement per combination) they are NULL when unset, so they don't
+# multiply the listing statements; nothing indexes them anyway.
+REFINEMENT_CONDITIONS = {
+    'price': f"(%(price)s::int IS NULL OR {PRICE_BUCKET_SQL} = %(price)s)",
+    'weather': "(%(weather)s::text IS NULL OR p.weather_tag = %(weather)s)",
+    'style': "(%(style)s::text IS NULL OR p.style_tag = %(style)s)",
+}
+CATEGORY_CONDITION = "p.category = %(category)s"
+
+
+def price_bucket_label(bucket):
+    bounds = (0,) + FACET_PRICE_BOUNDS
+    low = bounds[bucket] // 100
+    if bucket == 0:
+        return f"Under ${FACET_PRICE_BOUNDS[0] // 100}"
+    if bucket >= len(FACET_PRICE_BOUNDS):
+        return f"${low}+"
+    return f"${low}-${FACET_PRICE_BOUNDS[bucket] // 100}"
+
+
+def price_buckets():
+    """(bucket, label) for every price bucket, cheapest first"""
+    return [(bucket, price_bucket_label(bucket)) for bucket in range(len(FACET_PRICE_BOUNDS) + 1)]
+
+
+def _grouping_code(*dimensions):
+    """GROUPING(category, price, weather, style) of the grouping set of these dimensions"""
+    code = 0
+    for position, dimension in enumerate(DIMENSIONS):
+        if dimension not in dimensions:
+            code |= 1 << (len(DIMENSIONS) - 1 - position)
+    return code
+
+
+GROUPING = "GROUPING(m.category, m.price, m.weather, m.style)"
+
+
+# =======================
+# Counts
+# =======================
+class FacetCounts:
+    """counts[dimension][value] -> products; None values (untagged) are counted but not offered"""
+
+    def __init__(self, counts=None):
+        self.counts = {dimension: {} for dimension in DIMENSIONS}
+        for dimension, values in (counts or {}).items():
+            self.counts[dimension].update(values)
+
+    @classmethod
+    def from_json(cls, entries):
+        """From facet_counts_sql()'s [[dimension, value, count], ...] (JSON text, list or None)"""
+        if isinstance(entries, str):
+            entries = json.loads(entries)
+        facets = cls()
+        for dimension, value, count in entries or ():
+            if dimension == 'price' and value is not None:
+                value = int(value)
+            facets.counts[dimension][value] = count
+        return facets
+
+    def get(self, dimension, value):
+        return self.counts[dimension].get(value, 0)
+
+    def options(self, dimension):
+        """(value, count) of a dimension's values, most products first"""
+        values = [(value, count) for value, count in self.counts[dimension].items() if value is not None]
+        if dimension == 'price':
+            return sorted(values)
+        return sorted(values, key=lambda item: (-item[1], item[0]))
+
+    @property
+    def total(self):
+        """Products matching every filter but the category"""
+        return sum(self.counts['category'].values())
+
+
+def facet_counts_sql(where, category):
+    """
+    Scalar subquery with the facet counts of the products matching where (a
+    list of conditions on products p, without the facet filters) as JSON
+    [[dimension, value, count], ...]; category: whether the category filter
+    applies. Uncorrelated, so Postgres evaluates it once per execution.
+    """
+    ok = {'category': CATEGORY_CONDITION if category else "TRUE"}
+    ok.update(REFINEMENT_CONDITIONS)
+    columns = ',\n'.join(
+        [f"{DIMENSION_COLUMNS[dimension]} AS {dimension}" for dimension in DIMENSIONS]
+        + [f"{ok[dimension]} AS {dimension}_ok" for dimension in DIMENSIONS]
+    )
+    dimension_cases, value_cases, count_cases = [], [], []
+    for dimension in DIMENSIONS:
+        code = _grouping_code(dimension)
+        others = ' AND '.join(f"m.{other}_ok" for other in DIMENSIONS if other != dimension)
+        dimension_cases.append(f"WHEN {code} THEN '{dimension}'")
+        value_cases.append(f"WHEN {code} THEN m.{dimension}::text")
+        count_cases.append(f"WHEN {code} THEN count(*) FILTER (WHERE {others})")
+    return f"""(
+        SELECT json_agg(json_build_array(f.dimension, f.value, f.count))
+        FROM (
+            SELECT CASE {GROUPING} {' '.join(dimension_cases)} END AS dimension,
+                   CASE {GROUPING} {' '.join(value_cases)} END AS value,
+                   CASE {GROUPING} {' '.join(count_cases)} END AS count
+            FROM (
+                SELECT {columns}
+                FROM products p
+                WHERE {' AND '.join(where)}
+            ) m
+            GROUP BY GROUPING SETS ({', '.join(f'(m.{dimension})' for dimension in DIMENSIONS)})
+        ) f
+    )"""
+
+
+# =======================
+# Unfiltered facets cache
+# =======================
+# Whole-catalog counts per dimension, and per category for the others
+_SCOPED_SETS = [(dimension,) for dimension in DIMENSIONS] + [
+    ('category', dimension) for dimension in DIMENSIONS if dimension != 'category'
+]
+CATALOG_FACETS = db.statement('catalog_facets', f"""
+    SELECT {GROUPING} AS grouping, m.category, m.price, m.weather, m.style, count(*) AS count
+    FROM (
+        SELECT {', '.join(f"{DIMENSION_COLUMNS[dimension]} AS {dimension}" for dimension in DIMENSIONS)}
+        FROM products p
+        WHERE p.active = TRUE
+    ) m
+    GROUP BY GROUPING SETS ({', '.join('(' + ', '.join(f'm.{d}' for d in dims) + ')' for dims in _SCOPED_SETS)})
+""")
+
+
+def load_catalog_facets(conn):
+    """Category -> FacetCounts of the unfiltered listing in that category (None: all categories)"""
+    codes = {_grouping_code(*dims): dims for dims in _SCOPED_SETS}
+    overall = {dimension: {} for dimension in DIMENSIONS}
+    scoped = {}
+    cur = conn.cursor()
+    try:
+        db.execute(cur, CATALOG_FACETS)
+        for grouping, category, price, weather, style, count in cur.fetchall():
+            dims = codes[grouping]
+            values = {'category': category, 'price': price, 'weather': weather, 'style': style}
+            dimension = dims[-1]
+            if len(dims) == 1:
+                overall[dimension][values[dimension]] = count
+            elif category is not None:  # uncategorised products are only in the "All" listing
+                scoped.setdefault(category, {}).setdefault(dimension, {})[values[dimension]] = count
+    finally:
+        cur.close()
+
+    by_category = {None: FacetCounts(overall)}
+    for category, counts in scoped.items():
+        # Category counts ignore the category filter, like the filtered facets
+        by_category[category] = FacetCounts(dict(counts, category=overall['category']))
+    return by_category
+
+
+class FacetCache:
+    """Unfiltered facets of the current catalog_version, shared by the process's threads"""
+
+    def __init__(self):
+        self.version = None
+        self._by_category = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, get_conn, category=None):
+        """FacetCounts of the unfiltered listing in category (None: all)"""
+        by_category = self._by_category
+        if by_category is None or time.monotonic() - self._checked_at >= catalog.CATALOG_VERSION_CHECK_SECONDS:
+            by_category = self._refresh(get_conn)
+        counts = by_category.get(category)
+        if counts is None:
+            # A category without active products: nothing in it, same category counts
+            counts = FacetCounts({'category': by_category[None].counts['category']})
+        return counts
+
+    def _refresh(self, get_conn):
+        with self._lock:
+            if self._by_category is not None and \
+                    time.monotonic() - self._checked_at < catalog.CATALOG_VERSION_CHECK_SECONDS:
+                return self._by_category
+            conn = get_conn()
+            try:
+                version = catalog.fetch_catalog_version(conn)
+                if self._by_category is None or version != self.version:
+                    start = time.perf_counter()
+                    self._by_category = load_catalog_facets(conn)
+                    self.version = version
+                    print(f">>> Catalog facets loaded in {time.perf_counter() - start:.2f}s "
+                          f"(version {version}, {len(self._by_category) - 1} categories)")
+                self._checked_at = time.monotonic()
+            finally:
+                conn.close()
+            return self._by_category
+
+    def invalidate(self):
+        """Force a version check on the next get()"""
+        self._checked_at = 0.0
+
+
+facet_cache = FacetCache()
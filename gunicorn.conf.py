@@ -0,0 +1,67 @@
+# Gunicorn configuration for production serving
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported once in the master (preload_app), caches are warmed
+# there before any worker is forked, and each worker re-creates its own
+# DB pool and API clients right after fork.
+#
+# Graceful reload: `kill -HUP <master pid>` re-warms caches in the master and
+# replaces workers one generation at a time; in-flight requests finish within
+# graceful_timeout. With preload_app, code changes need a full restart
+# (or USR2 + QUIT for a zero-downtime binary upgrade).
+import os
+import multiprocessing
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# Sync workers with a few threads each: most time is spent waiting on
+# Postgres and Gemini, not in Python.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', '4'))
+worker_class = 'gthread'
+
+preload_app = True
+timeout = int(os.environ.get('WEB_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# Recycle workers periodically so slow leaks can't accumulate
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', '200'))
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def _app_module():
+    import app
+    return app
+
+
+def when_ready(server):
+    """Master: warm caches once, then release its DB connections before forking"""
+    app = _app_module()
+    try:
+        app.warm_caches()
+    except Exception as e:
+        server.log.warning(f"Cache warm-up failed, workers will load lazily: {e}")
+    app.db.close_pools()
+
+
+def on_reload(server):
+    """Master: refresh caches so the next worker generation starts warm"""
+    app = _app_module()
+    try:
+        app.catalog.invalidate_catalog_snapshot()
+        app.warm_caches()
+    except Exception as e:
+        server.log.warning(f"Cache refresh on reload failed: {e}")
+    app.db.close_pools()
+
+
+def post_fork(server, worker):
+    """Worker: never share sockets with the master or sibling workers"""
+    app = _app_module()
+    app.reset_after_fork()
+    app.start_background_jobs()
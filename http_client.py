@@ -0,0 +1,204 @@
+"""
+Shared outbound HTTP client.
+
+One requests.Session per worker process (re-created after fork), with a
+keep-alive connection pool per host, so repeated calls to the same host
+(Naver search, its image CDN, our own /product_image URLs) reuse TCP/TLS
+connections instead of handshaking every time.
+
+  - GET/HEAD are retried with exponential backoff on connection errors and
+    502/503/504 (HTTP_RETRIES, HTTP_RETRY_BACKOFF), except with
+    retries=False: calls inside an outbound guard use that, because each
+    attempt would get the guard's full timeout and the guard's breaker
+    already decides when to try again
+  - response bodies are read in chunks and capped (HTTP_MAX_RESPONSE_MB);
+    bigger responses raise ResponseTooLarge instead of filling memory
+  - download_to_file() streams a body straight to a temp file, which the
+    image pipeline reads from (images.fetch_image)
+  - per-host counters (requests, errors, bytes, time, connections opened)
+    are available from metrics()
+
+Timeouts still come from the caller (usually an outbound guard).
+"""
+import os
+import time
+import tempfile
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', '16'))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '8'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+HTTP_RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF', '0.3'))
+HTTP_MAX_RESPONSE_MB = float(os.environ.get('HTTP_MAX_RESPONSE_MB', '16'))
+HTTP_USER_AGENT = os.environ.get('HTTP_USER_AGENT', 'PetFit/1.0')
+
+DEFAULT_MAX_BYTES = int(HTTP_MAX_RESPONSE_MB * 1024 * 1024)
+CHUNK_SIZE = 64 * 1024
+
+
+class ResponseTooLarge(ValueError):
+    """Response body exceeded the size cap"""
+
+
+# =======================
+# Session
+# =======================
+_lock = threading.Lock()
+_sessions = {}  # retries (bool) -> requests.Session
+_session_pid = None
+_metrics = defaultdict(lambda: {'requests': 0, 'errors': 0, 'bytes': 0, 'elapsed_ms': 0.0})
+
+
+def _build_session(retries):
+    retry = Retry(
+        total=HTTP_RETRIES if retries else 0,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = HTTP_USER_AGENT
+    return session
+
+
+def get_session(retries=True):
+    """Shared session for this process; retries=False: one without urllib3 retries"""
+    global _session_pid
+    pid = os.getpid()
+    session = _sessions.get(retries) if _session_pid == pid else None
+    if session is None:
+        with _lock:
+            if _session_pid != pid:
+                _sessions.clear()
+                _session_pid = pid
+                _metrics.clear()
+            session = _sessions.get(retries)
+            if session is None:
+                session = _sessions[retries] = _build_session(retries)
+    return session
+
+
+def reset():
+    """Drop the sessions inherited from a parent process (call after fork)"""
+    global _session_pid
+    with _lock:
+        _sessions.clear()
+        _session_pid = None
+        _metrics.clear()
+
+
+# =======================
+# Requests
+# =======================
+def _record(host, elapsed, nbytes=0, error=False):
+    with _lock:
+        entry = _metrics[host]
+        entry['requests'] += 1
+        entry['bytes'] += nbytes
+        entry['elapsed_ms'] += elapsed * 1000
+        if error:
+            entry['errors'] += 1
+
+
+def _check_declared_length(response, max_bytes):
+    declared = response.headers.get('Content-Length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        response.close()
+        raise ResponseTooLarge(f"{response.url}: Content-Length {declared} exceeds {max_bytes} bytes")
+
+
+def _iter_capped(response, max_bytes):
+    total = 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_bytes:
+            response.close()
+            raise ResponseTooLarge(f"{response.url}: body exceeds {max_bytes} bytes")
+        yield chunk
+
+
+def get(url, timeout, max_bytes=DEFAULT_MAX_BYTES, retries=True, **kwargs):
+    """GET through the shared session; the body is read (capped) before returning"""
+    host = urlsplit(url).netloc
+    start = time.monotonic()
+    nbytes = 0
+    try:
+        response = get_session(retries).get(url, timeout=timeout, stream=True, **kwargs)
+        try:
+            _check_declared_length(response, max_bytes)
+            # Same as requests does for non-streamed responses, with a cap
+            response._content = b''.join(_iter_capped(response, max_bytes))
+            nbytes = len(response._content)
+        finally:
+            response.close()
+    except Exception:
+        _record(host, time.monotonic() - start, nbytes, error=True)
+        raise
+    _record(host, time.monotonic() - start, nbytes, error=response.status_code >= 500)
+    return response
+
+
+def download_to_file(url, timeout, max_bytes=DEFAULT_MAX_BYTES, retries=True, **kwargs):
+    """
+    Stream a GET body to a temp file without holding it in memory.
+    Returns (path, response); the caller removes the file. Raises
+    requests.HTTPError for non-2xx responses.
+    """
+    host = urlsplit(url).netloc
+    start = time.monotonic()
+    nbytes = 0
+    path = None
+    try:
+        with get_session(retries).get(url, timeout=timeout, stream=True, **kwargs) as response:
+            response.raise_for_status()
+            _check_declared_length(response, max_bytes)
+            fd, path = tempfile.mkstemp(prefix='petfit_download_', suffix='.img')
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in _iter_capped(response, max_bytes):
+                    out.write(chunk)
+                    nbytes += len(chunk)
+    except Exception:
+        _record(host, time.monotonic() - start, nbytes, error=True)
+        if path and os.path.exists(path):
+            os.remove(path)
+        raise
+    _record(host, time.monotonic() - start, nbytes)
+    return path, response
+
+
+# =======================
+# Metrics
+# =======================
+def metrics():
+    """Per-host counters for this process, with connection reuse from the urllib3 pools"""
+    with _lock:
+        snapshot = {host: dict(entry) for host, entry in _metrics.items()}
+        sessions = list(_sessions.values()) if _session_pid == os.getpid() else []
+
+    for session in sessions:
+        adapter = session.get_adapter('https://')
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            entry = snapshot.setdefault(host, {'requests': 0, 'errors': 0, 'bytes': 0, 'elapsed_ms': 0.0})
+            entry['connections_opened'] = entry.get('connections_opened', 0) + pool.num_connections
+            entry['pool_requests'] = entry.get('pool_requests', 0) + pool.num_requests
+
+    for entry in snapshot.values():
+        entry['elapsed_ms'] = round(entry['elapsed_ms'], 1)
+        if entry['requests']:
+            entry['avg_ms'] = round(entry['elapsed_ms'] / entry['requests'], 1)
+    return snapshot
@@ -0,0 +1,149 @@
+"""
+Image normalization pipeline.
+
+Uploads are spooled to a temp file, checked with Pillow (header only) while
+the request is still open, and then decoded, EXIF-rotated, downscaled to
+IMAGE_MAX_EDGE and re-encoded on a background thread pool. The compact
+result is what gets stored in the database and sent to Gemini. Remote
+images (product photos) are streamed to a temp file by http_client and go
+through the same normalization.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+import http_client
+
+
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', '1280'))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '85'))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', '2'))
+
+OUTPUT_MIME_TYPE = 'image/jpeg'
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF', 'BMP', 'MPO', 'HEIF'}
+
+
+class ImageValidationError(ValueError):
+    """Upload is not an image we accept"""
+
+
+# =======================
+# Spooling and validation
+# =======================
+def spool_upload(file_storage, chunk_size=64 * 1024):
+    """Copy an uploaded file to a temp file that outlives the request; returns its path"""
+    fd, path = tempfile.mkstemp(prefix='petfit_upload_', suffix='.img')
+    with os.fdopen(fd, 'wb') as out:
+        shutil.copyfileobj(file_storage.stream, out, chunk_size)
+    return path
+
+
+def validate_image(path):
+    """Cheap header check (no full decode); raises ImageValidationError"""
+    try:
+        with Image.open(path) as img:
+            if img.format not in ACCEPTED_FORMATS:
+                raise ImageValidationError(f"Unsupported image format: {img.format}")
+            width, height = img.size
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageValidationError("File is not a valid image") from e
+    except Image.DecompressionBombError as e:
+        raise ImageValidationError("Image is too large") from e
+    if not width or not height:
+        raise ImageValidationError("Image has no pixels")
+
+
+# =======================
+# Normalization
+# =======================
+def normalize_image(source, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY):
+    """
+    Decode, apply EXIF orientation, downscale so the longest edge is at most
+    max_edge, and re-encode as JPEG. source is a path or a binary file object.
+    Returns (jpeg_bytes, mime_type).
+    """
+    try:
+        with Image.open(source) as img:
+            # Let the JPEG decoder downscale by 1/2..1/8 while decoding
+            img.draft('RGB', (max_edge, max_edge))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+                rgba = img.convert('RGBA')
+                flattened = Image.new('RGB', rgba.size, (255, 255, 255))
+                flattened.paste(rgba, mask=rgba.getchannel('A'))
+                img = flattened
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            out = io.BytesIO()
+            img.save(out, format='JPEG', quality=quality, optimize=True, progressive=True)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise ImageValidationError(f"Could not decode image: {e}") from e
+    return out.getvalue(), OUTPUT_MIME_TYPE
+
+
+def normalize_image_bytes(data, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY):
+    """normalize_image() for in-memory bytes"""
+    return normalize_image(io.BytesIO(data), max_edge, quality)
+
+
+def fetch_image(url, timeout, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY, retries=True):
+    """Download an image (streamed to a temp file) and normalize it; returns (jpeg_bytes, mime_type)"""
+    path, _ = http_client.download_to_file(url, timeout, retries=retries)
+    try:
+        validate_image(path)
+        return normalize_image(path, max_edge, quality)
+    finally:
+        os.remove(path)
+
+
+# =======================
+# Background processing
+# =======================
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Per-process thread pool for image work (re-created after fork)"""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _process_spooled(path, on_done, on_error):
+    try:
+        try:
+            data, mime_type = normalize_image(path)
+            on_done(data, mime_type)
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(e)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def process_upload_async(path, on_done, on_error=None):
+    """
+    Normalize a spooled upload in the background and call on_done(data, mime_type).
+    If decoding or on_done fails, on_error(exception) is called instead (without
+    one, the exception is left on the returned future). The temp file is
+    removed afterwards either way.
+    """
+    return get_executor().submit(_process_spooled, path, on_done, on_error)
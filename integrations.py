@@ -0,0 +1,146 @@
+"""
+Optional third-party integrations (Gemini, Google Translate).
+
+Nothing here imports google.genai or deep_translator at module import time:
+each SDK is imported on first use and clients are built once per process,
+thread-safely. available_integrations() reports what could be used without
+importing anything.
+"""
+import os
+import sys
+import importlib
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
+# Alternative endpoints (e.g. bench/fake_services.py for load tests); unset = the real services
+GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL', '')
+TRANSLATOR_BASE_URL = os.environ.get('TRANSLATOR_BASE_URL', '')
+# Threads that run translator calls (deep_translator sets no request timeout)
+TRANSLATOR_THREADS = int(os.environ.get('TRANSLATOR_THREADS', '4'))
+
+_lock = threading.Lock()
+_gemini_client = None
+_gemini_client_pid = None
+_gemini_checked = False
+_translate_executor = None
+_translate_executor_pid = None
+
+
+def _module_available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def gemini_key_configured():
+    return bool(GOOGLE_API_KEY and "AIza" in GOOGLE_API_KEY)
+
+
+def available_integrations():
+    """Which integrations are installed/configured, without importing their SDKs"""
+    return {
+        'gemini': {
+            'installed': _module_available('google.genai'),
+            'configured': gemini_key_configured(),
+            'loaded': _gemini_client is not None,
+            'base_url': GEMINI_BASE_URL or None,
+        },
+        'translator': {
+            'installed': _module_available('deep_translator'),
+            'configured': True,
+            'loaded': 'deep_translator' in sys.modules,
+            'base_url': TRANSLATOR_BASE_URL or None,
+        },
+    }
+
+
+# =======================
+# Gemini
+# =======================
+def genai_types():
+    """google.genai.types, imported on first use"""
+    return importlib.import_module('google.genai.types')
+
+
+def get_gemini_client():
+    """Shared Gemini client for this process, or None when unavailable"""
+    global _gemini_client, _gemini_client_pid, _gemini_checked
+    pid = os.getpid()
+    if _gemini_checked and _gemini_client_pid == pid:
+        return _gemini_client
+
+    with _lock:
+        if _gemini_checked and _gemini_client_pid == pid:
+            return _gemini_client
+
+        client = None
+        if gemini_key_configured():
+            try:
+                from google import genai
+                http_options = {'base_url': GEMINI_BASE_URL} if GEMINI_BASE_URL else None
+                client = genai.Client(api_key=GOOGLE_API_KEY, http_options=http_options)
+                print(">>> Gemini Client Initialized.")
+            except Exception as e:
+                print(f">>> Gemini Client Init Error: {e}")
+        else:
+            print(">>> Warning: Google API Key is missing or invalid.")
+
+        _gemini_client = client
+        _gemini_client_pid = pid
+        _gemini_checked = True
+        return client
+
+
+# =======================
+# Translation
+# =======================
+def get_translator(source='ko', target='en'):
+    """deep_translator GoogleTranslator, imported on first use"""
+    from deep_translator import GoogleTranslator
+    translator = GoogleTranslator(source=source, target=target)
+    if TRANSLATOR_BASE_URL:
+        translator._base_url = TRANSLATOR_BASE_URL
+    return translator
+
+
+def _translator_executor():
+    global _translate_executor, _translate_executor_pid
+    pid = os.getpid()
+    if _translate_executor is None or _translate_executor_pid != pid:
+        with _lock:
+            if _translate_executor is None or _translate_executor_pid != pid:
+                _translate_executor = ThreadPoolExecutor(TRANSLATOR_THREADS, thread_name_prefix='translator')
+                _translate_executor_pid = pid
+    return _translate_executor
+
+
+def translate(translator, text, timeout):
+    """
+    translator.translate(text), giving up after timeout seconds with
+    TimeoutError. deep_translator's requests have no timeout of their own,
+    so the call runs on a TRANSLATOR_THREADS pool and the caller stops
+    waiting; a hung request keeps its pool thread until the connection
+    drops, so later calls queue (and time out) instead of piling up threads.
+    """
+    future = _translator_executor().submit(translator.translate, text)
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"translation did not finish within {timeout:.2f}s")
+
+
+def reset():
+    """Forget clients built in a parent process (call after fork)"""
+    global _gemini_client, _gemini_client_pid, _gemini_checked, _translate_executor, _translate_executor_pid
+    with _lock:
+        _gemini_client = None
+        _gemini_client_pid = None
+        _gemini_checked = False
+        # The parent's pool threads don't exist in the child
+        _translate_executor = None
+        _translate_executor_pid = None
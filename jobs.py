@@ -0,0 +1,473 @@
+"""
+Maintenance and background jobs.
+
+Recommendation logs
+-------------------
+recommendation_logs is partitioned by UTC month (recommendation_logs_pYYYYMM,
+see db/migrate_partition_recommendation_logs.sql). run_maintenance() is meant
+to run daily (`flask reco-maintenance`, e.g. from cron):
+
+  - ensure_partitions: create next months' partitions ahead of time, so
+    inserts never land in the default partition (the background scheduler
+    below also runs it, so this doesn't depend on cron; rows that did land
+    in the default partition are moved when their month is created)
+  - rollup_days: (re)build recommendation_daily_rollups for recent days
+  - apply_retention: roll up and then DROP partitions older than the
+    retention window; no row-by-row DELETE, no table bloat
+
+Analytics read the rollups, never the raw logs.
+
+Popularity
+----------
+update_popularity() folds new recommendation_logs and cart_events rows
+(past the ids stored in job_watermarks) into a time-decayed weight per
+product and derives products.popularity_score from it. Each run reads only
+new events plus a bounded batch of stale weights to decay, so its cost does
+not grow with history. Ids the watermark skips (transactions still open
+when a later id committed) are kept in job_watermarks.gaps and re-read on
+later runs, so slow inserts are counted late rather than never.
+start_scheduler() runs it periodically in every
+worker; a transaction-level advisory lock lets only one run at a time.
+Score changes bump catalog_version.popularity_version, not the catalog
+version, so catalog snapshots refresh that column instead of reloading.
+
+Pet features
+------------
+The same scheduler computes pet feature vectors that triggers reset to
+NULL (breed averages or pet inputs changed outside the app), see
+pet_features.refresh_stale().
+"""
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from psycopg2.extras import execute_values
+
+import pet_features
+
+
+RECOMMENDATION_LOG_RETENTION_MONTHS = int(os.environ.get('RECOMMENDATION_LOG_RETENTION_MONTHS', '6'))
+RECOMMENDATION_PARTITIONS_AHEAD = int(os.environ.get('RECOMMENDATION_PARTITIONS_AHEAD', '3'))
+RECOMMENDATION_ROLLUP_DAYS = int(os.environ.get('RECOMMENDATION_ROLLUP_DAYS', '2'))
+
+POPULARITY_HALF_LIFE_DAYS = float(os.environ.get('POPULARITY_HALF_LIFE_DAYS', '14'))
+POPULARITY_PRIOR = float(os.environ.get('POPULARITY_PRIOR', '0.5'))
+POPULARITY_SCALE = float(os.environ.get('POPULARITY_SCALE', '50'))
+POPULARITY_CART_WEIGHT = float(os.environ.get('POPULARITY_CART_WEIGHT', '5'))
+POPULARITY_BATCH_SIZE = int(os.environ.get('POPULARITY_BATCH_SIZE', '5000'))
+POPULARITY_DECAY_REFRESH_HOURS = float(os.environ.get('POPULARITY_DECAY_REFRESH_HOURS', '6'))
+POPULARITY_JOB_INTERVAL_SECONDS = int(os.environ.get('POPULARITY_JOB_INTERVAL_SECONDS', '300'))
+POPULARITY_JOB_ENABLED = os.environ.get('POPULARITY_JOB_ENABLED', '1') == '1'
+
+PARTITION_NAME = re.compile(r'^recommendation_logs_p(\d{4})(\d{2})$')
+
+
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+def add_months(month, count):
+    """First day of the month `count` months after `month`"""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# =======================
+# Partitions
+# =======================
+def ensure_partitions(conn, months_ahead=RECOMMENDATION_PARTITIONS_AHEAD):
+    """Create missing partitions from this month through months_ahead; returns how many were created"""
+    this_month = utc_today().replace(day=1)
+    cur = conn.cursor()
+    cur.execute("SELECT ensure_recommendation_log_partitions(%s, %s)",
+                (this_month, add_months(this_month, months_ahead)))
+    created = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return created
+
+
+def list_partitions(conn):
+    """[(month_start, partition_name)] for the monthly partitions, oldest first"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'recommendation_logs'::regclass
+    """)
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    cur.close()
+    return sorted(partitions)
+
+
+# =======================
+# Rollups
+# =======================
+ROLLUP_SQL = """
+    INSERT INTO recommendation_daily_rollups
+        (day, product_id, product_size_id, impressions, distinct_pets,
+         avg_score_total, avg_score_fit, avg_score_weather,
+         avg_score_style, avg_score_price, avg_score_popularity)
+    SELECT (created_at AT TIME ZONE 'UTC')::date,
+           product_id,
+           product_size_id,
+           count(*),
+           count(DISTINCT pet_id),
+           avg(score_total),
+           avg(score_fit),
+           avg(score_weather),
+           avg(score_style),
+           avg(score_price),
+           avg(score_popularity)
+    FROM recommendation_logs
+    WHERE created_at >= %(start)s::timestamp AT TIME ZONE 'UTC'
+      AND created_at < %(end)s::timestamp AT TIME ZONE 'UTC'
+      AND product_id IS NOT NULL
+      AND product_size_id IS NOT NULL
+    GROUP BY 1, 2, 3
+"""
+
+
+def rollup_days(conn, first_day, last_day):
+    """Rebuild rollups for first_day..last_day (inclusive, UTC); returns rows written"""
+    params = {'start': first_day, 'end': last_day + timedelta(days=1)}
+    cur = conn.cursor()
+    cur.execute("DELETE FROM recommendation_daily_rollups WHERE day >= %(start)s AND day < %(end)s", params)
+    cur.execute(ROLLUP_SQL, params)
+    written = cur.rowcount
+    conn.commit()
+    cur.close()
+    return written
+
+
+def rollup_recent(conn, days=RECOMMENDATION_ROLLUP_DAYS):
+    """Rebuild rollups for the last `days` days including today (today is partial)"""
+    today = utc_today()
+    return rollup_days(conn, today - timedelta(days=days - 1), today)
+
+
+# =======================
+# Retention
+# =======================
+def apply_retention(conn, months=RECOMMENDATION_LOG_RETENTION_MONTHS):
+    """
+    Drop monthly partitions that ended before the retention window, rolling
+    each one up first so no history is lost. Returns the dropped names.
+    """
+    cutoff = add_months(utc_today().replace(day=1), -months)
+    dropped = []
+    for month, name in list_partitions(conn):
+        if month >= cutoff:
+            break
+        rollup_days(conn, month, add_months(month, 1) - timedelta(days=1))
+        cur = conn.cursor()
+        # name comes from pg_class and matched PARTITION_NAME
+        cur.execute(f'DROP TABLE IF EXISTS "{name}"')
+        conn.commit()
+        cur.close()
+        dropped.append(name)
+        print(f">>> Dropped recommendation log partition {name}")
+    return dropped
+
+
+def run_maintenance(conn, retention_months=RECOMMENDATION_LOG_RETENTION_MONTHS,
+                    rollup_days_back=RECOMMENDATION_ROLLUP_DAYS):
+    """Partitions ahead, recent rollups, retention; returns a summary dict"""
+    return {
+        'partitions_created': ensure_partitions(conn),
+        'rollup_rows': rollup_recent(conn, rollup_days_back),
+        'partitions_dropped': apply_retention(conn, retention_months),
+    }
+
+
+# =======================
+# Analytics (rollups only)
+# =======================
+def recommendation_stats(conn, days=30, limit=50):
+    """Most recommended products over the last `days` days, with impression-weighted average scores"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT r.product_id,
+               p.name,
+               sum(r.impressions) AS impressions,
+               sum(r.impressions * r.avg_score_total) / sum(r.impressions) AS avg_score_total,
+               sum(r.impressions * r.avg_score_fit) / sum(r.impressions) AS avg_score_fit
+        FROM recommendation_daily_rollups r
+        LEFT JOIN products p ON p.id = r.product_id
+        WHERE r.day >= %s
+        GROUP BY r.product_id, p.name
+        ORDER BY impressions DESC, r.product_id
+        LIMIT %s
+    """, (utc_today() - timedelta(days=days - 1), limit))
+    rows = [
+        {
+            'product_id': product_id,
+            'name': name,
+            'impressions': int(impressions),
+            'avg_score_total': round(float(avg_total), 4) if avg_total is not None else None,
+            'avg_score_fit': round(float(avg_fit), 4) if avg_fit is not None else None,
+        }
+        for product_id, name, impressions, avg_total, avg_fit in cur.fetchall()
+    ]
+    cur.close()
+    return rows
+
+
+# =======================
+# Popularity
+# =======================
+POPULARITY_LOCK_ID = 0x70657466  # pg advisory lock key for update_popularity
+
+# Ids the watermark skips over belong to transactions that have not committed
+# yet (or rolled back). They are re-read on later runs until they show up or
+# are this old; at most WATERMARK_MAX_GAPS are tracked per source.
+WATERMARK_GAP_SECONDS = 600
+WATERMARK_MAX_GAPS = 10000
+
+# (watermark name, table, event weight)
+POPULARITY_SOURCES = (
+    ('popularity:recommendation_logs', 'recommendation_logs', "1.0"),
+    ('popularity:cart_events', 'cart_events', "qty * %(cart_weight)s"),
+)
+
+# New events past the watermark, and late commits of skipped ids
+EVENTS_SQL = """
+    SELECT id, product_id, created_at, {weight}
+    FROM {table}
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(limit)s
+"""
+LATE_EVENTS_SQL = """
+    SELECT id, product_id, created_at, {weight}
+    FROM {table}
+    WHERE id = ANY(%(ids)s)
+"""
+
+
+def decay_rate(half_life_days=POPULARITY_HALF_LIFE_DAYS):
+    """Per-second exponential decay constant"""
+    return math.log(2) / (half_life_days * 86400)
+
+
+def popularity_from_weight(weight, prior=POPULARITY_PRIOR, scale=POPULARITY_SCALE):
+    """
+    Map a decayed event weight to a 0-1 score: `prior` with no activity,
+    approaching 1 as activity grows, and back towards `prior` as it decays.
+    """
+    return round(1 - (1 - prior) * math.exp(-max(weight, 0.0) / scale), 2)
+
+
+def _watermark(cur, job):
+    cur.execute("INSERT INTO job_watermarks (job) VALUES (%s) ON CONFLICT (job) DO NOTHING", (job,))
+    cur.execute("SELECT last_id, gaps FROM job_watermarks WHERE job = %s FOR UPDATE", (job,))
+    last_id, gaps = cur.fetchone()
+    return last_id, {int(event_id): seen_at for event_id, seen_at in gaps.items()}
+
+
+def _track_gaps(gaps, after, event_ids, found, now_epoch):
+    """
+    Skipped ids still worth re-reading: the old ones not found and not
+    expired, plus the holes between the ids just read
+    """
+    horizon = now_epoch - WATERMARK_GAP_SECONDS
+    kept = {event_id: seen_at for event_id, seen_at in gaps.items()
+            if event_id not in found and seen_at >= horizon}
+    previous = after
+    for event_id in event_ids:
+        for missing in range(previous + 1, min(event_id, previous + 1 + WATERMARK_MAX_GAPS)):
+            kept[missing] = now_epoch
+        previous = event_id
+    if len(kept) > WATERMARK_MAX_GAPS:
+        print(f">>> Watermark tracks {len(kept)} skipped ids, keeping the newest {WATERMARK_MAX_GAPS}")
+        kept = dict(sorted(kept.items())[-WATERMARK_MAX_GAPS:])
+    return kept
+
+
+def _read_events(cur, job, table, weight, now, rate, batch_size):
+    """
+    Aggregate new events of one source: rows past the watermark, plus rows
+    of ids it skipped earlier that have committed since. Returns
+    ({product_id: (weight, count)}, new_last_id, gaps, new rows, late rows).
+    """
+    after, gaps = _watermark(cur, job)
+    params = {'after': after, 'limit': batch_size, 'cart_weight': POPULARITY_CART_WEIGHT}
+    cur.execute(EVENTS_SQL.format(table=table, weight=weight), params)
+    rows = cur.fetchall()
+    late = []
+    if gaps:
+        cur.execute(LATE_EVENTS_SQL.format(table=table, weight=weight), dict(params, ids=list(gaps)))
+        late = cur.fetchall()
+
+    totals = defaultdict(lambda: [0.0, 0])
+    for event_id, product_id, created_at, event_weight in rows + late:
+        if product_id is None:
+            continue
+        age = max((now - created_at).total_seconds(), 0.0)
+        totals[product_id][0] += float(event_weight) * math.exp(-rate * age)
+        totals[product_id][1] += 1
+    last_id = rows[-1][0] if rows else after
+    gaps = _track_gaps(gaps, after, [row[0] for row in rows], {row[0] for row in late}, now.timestamp())
+    return totals, last_id, gaps, len(rows), len(late)
+
+
+def update_popularity(conn, batch_size=POPULARITY_BATCH_SIZE):
+    """
+    One incremental popularity pass. Returns a summary dict, or None if
+    another process holds the job lock.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (POPULARITY_LOCK_ID,))
+    if not cur.fetchone()[0]:
+        conn.rollback()
+        cur.close()
+        return None
+
+    cur.execute("SELECT now()")
+    now = cur.fetchone()[0]
+    rate = decay_rate()
+
+    # 1. New events since the watermarks, decayed to `now`
+    increments = defaultdict(lambda: [0.0, 0, 0])  # weight, recommendations, cart adds
+    events = 0
+    more_pending = False
+    watermarks = []
+    for source_index, (job, table, weight) in enumerate(POPULARITY_SOURCES):
+        totals, last_id, gaps, count, late = _read_events(cur, job, table, weight, now, rate, batch_size)
+        events += count + late
+        more_pending = more_pending or count == batch_size
+        watermarks.append((last_id, json.dumps({str(event_id): seen_at for event_id, seen_at in gaps.items()}), job))
+        for product_id, (weight, n) in totals.items():
+            increments[product_id][0] += weight
+            increments[product_id][1 + source_index] += n
+
+    # 2. Fold them into the decayed weights (one statement)
+    weights = {}
+    if increments:
+        rows = execute_values(cur, f"""
+            INSERT INTO product_popularity AS pp
+                (product_id, decayed_weight, decayed_at, recommendations, cart_adds)
+            SELECT v.product_id, v.weight, v.decayed_at, v.recommendations, v.cart_adds
+            FROM (VALUES %s) AS v(product_id, weight, decayed_at, recommendations, cart_adds)
+            JOIN products p ON p.id = v.product_id
+            ON CONFLICT (product_id) DO UPDATE SET
+                decayed_weight = pp.decayed_weight
+                    * exp(-{rate:.17g} * extract(epoch FROM EXCLUDED.decayed_at - pp.decayed_at))
+                    + EXCLUDED.decayed_weight,
+                decayed_at = EXCLUDED.decayed_at,
+                recommendations = pp.recommendations + EXCLUDED.recommendations,
+                cart_adds = pp.cart_adds + EXCLUDED.cart_adds
+            RETURNING product_id, decayed_weight
+        """, [(pid, w, now, r, c) for pid, (w, r, c) in increments.items()],
+            template="(%s::bigint, %s::float8, %s::timestamptz, %s::bigint, %s::bigint)",
+            page_size=batch_size, fetch=True)
+        weights.update(rows)
+
+    # 3. Decay a bounded batch of weights that haven't been touched lately
+    cur.execute("""
+        UPDATE product_popularity
+        SET decayed_weight = decayed_weight * exp(-%(rate)s * extract(epoch FROM %(now)s - decayed_at)),
+            decayed_at = %(now)s
+        WHERE product_id IN (
+            SELECT product_id FROM product_popularity
+            WHERE decayed_at < %(now)s - %(refresh)s * INTERVAL '1 hour'
+              AND decayed_weight > 0.001
+            ORDER BY decayed_at
+            LIMIT %(limit)s
+        )
+        RETURNING product_id, decayed_weight
+    """, {'rate': rate, 'now': now, 'refresh': POPULARITY_DECAY_REFRESH_HOURS, 'limit': batch_size})
+    decayed = cur.fetchall()
+    weights.update(decayed)
+
+    # 4. Write back scores that changed (one statement per batch)
+    changed = []
+    if weights:
+        cur.execute("SELECT id, popularity_score FROM products WHERE id = ANY(%s)", (list(weights),))
+        for product_id, current in cur.fetchall():
+            score = popularity_from_weight(weights[product_id])
+            if current is None or abs(float(current) - score) >= 0.005:
+                changed.append((product_id, score))
+    if changed:
+        execute_values(cur, """
+            UPDATE products p
+            SET popularity_score = v.score
+            FROM (VALUES %s) AS v(id, score)
+            WHERE p.id = v.id
+        """, changed, template="(%s::bigint, %s::numeric)", page_size=batch_size)
+        # The catalog version triggers ignore popularity_score; snapshots watch this instead
+        cur.execute("UPDATE catalog_version SET popularity_version = popularity_version + 1, updated_at = now()")
+
+    execute_values(cur, """
+        UPDATE job_watermarks w
+        SET last_id = v.last_id, gaps = v.gaps, updated_at = now()
+        FROM (VALUES %s) AS v(last_id, gaps, job)
+        WHERE w.job = v.job
+    """, watermarks, template="(%s::bigint, %s::jsonb, %s)")
+    conn.commit()
+    cur.close()
+    return {
+        'events': events,
+        'products_touched': len(increments),
+        'weights_decayed': len(decayed),
+        'scores_updated': len(changed),
+        'more_pending': more_pending,
+    }
+
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def _scheduler_loop(get_conn, interval):
+    # Stagger workers so they don't all wake (and contend for the lock) together
+    time.sleep(interval * (0.5 + (os.getpid() % 100) / 200))
+    while True:
+        try:
+            conn = get_conn()
+            try:
+                created = ensure_partitions(conn)
+                summary = update_popularity(conn)
+                refreshed = pet_features.refresh_stale(conn)
+            finally:
+                conn.close()
+            if created:
+                print(f">>> Recommendation log partitions created: {created}")
+            if summary and summary['scores_updated']:
+                print(f">>> Popularity updated: {summary}")
+            if refreshed:
+                print(f">>> Pet feature vectors refreshed: {refreshed}")
+            if summary and summary['more_pending']:
+                continue
+        except Exception as e:
+            print(f">>> Popularity job error: {e}")
+        time.sleep(interval)
+
+
+def start_scheduler(get_conn, interval=POPULARITY_JOB_INTERVAL_SECONDS):
+    """
+    Run partition creation, update_popularity and pet feature refreshes every
+    `interval` seconds on a daemon thread (once per process)
+    """
+    global _scheduler, _scheduler_pid
+    if not POPULARITY_JOB_ENABLED:
+        return None
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler_pid == os.getpid():
+            return _scheduler
+        _scheduler = threading.Thread(target=_scheduler_loop, args=(get_conn, interval),
+                                      name='popularity-job', daemon=True)
+        _scheduler_pid = os.getpid()
+        _scheduler.start()
+        return _scheduler
@@ -0,0 +1,374 @@
+"""
+Guards for outbound calls (Gemini, Naver, Google Translate).
+
+Each dependency gets a Guard with:
+  - a concurrency limit (OUTBOUND_<NAME>_CONCURRENCY) and a bounded wait
+    queue (OUTBOUND_<NAME>_QUEUE); callers beyond it fail fast with
+    QueueFull (HTTP 429) instead of tying up a worker thread,
+  - an adaptive timeout: a multiple of the recent p95 latency, clamped to
+    [floor, ceiling], so a dependency that is usually fast can't hold a
+    request for the full ceiling,
+  - a circuit breaker: after N consecutive failures calls are rejected with
+    CircuitOpen (HTTP 503) for reset_seconds, then one trial call is let
+    through (half-open) to decide whether to close again.
+
+Usage:
+
+    with outbound.guards['naver'].call() as call:
+        response = requests.get(url, timeout=call.timeout)
+        if response.status_code >= 500:
+            call.failed()
+
+An exception escaping the block counts as a failure. Callers catch
+outbound.Rejected to fall back to their existing degraded behaviour.
+
+Limits are per process (per gunicorn worker).
+
+Faults can be injected per dependency for testing, without any network:
+
+    OUTBOUND_FAULTS="gemini:latency=3,error_rate=0.5;naver:error_rate=1"
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# =======================
+# Errors
+# =======================
+class Rejected(Exception):
+    """Call was not attempted; the caller should degrade"""
+    status_code = 503
+
+    def __init__(self, dependency, message, retry_after=1):
+        super().__init__(f"{dependency}: {message}")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class QueueFull(Rejected):
+    """Too many callers already waiting for this dependency"""
+    status_code = 429
+
+
+class CircuitOpen(Rejected):
+    """Dependency is failing; short-circuited without calling it"""
+    status_code = 503
+
+
+class InjectedFault(Exception):
+    """Failure produced by OUTBOUND_FAULTS"""
+
+
+class InjectedTimeout(InjectedFault, TimeoutError):
+    """Injected latency exceeded the guard's timeout"""
+
+
+# =======================
+# Guard
+# =======================
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+LATENCY_WINDOW = 100
+
+
+def _is_timeout(exc):
+    return isinstance(exc, TimeoutError) or 'timeout' in type(exc).__name__.lower()
+
+
+class Call:
+    """Handle for one guarded call"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.ok = True
+
+    def failed(self):
+        """Count this call as a failure without raising (e.g. HTTP 5xx)"""
+        self.ok = False
+
+
+class Guard:
+    """Concurrency limit, wait queue, adaptive timeout and circuit breaker for one dependency"""
+
+    def __init__(self, name, max_concurrency=4, max_queue=8, queue_wait=2.0,
+                 timeout_floor=2.0, timeout_ceiling=10.0, timeout_multiplier=2.0,
+                 failure_threshold=5, reset_seconds=30.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_wait = queue_wait
+        self.timeout_floor = timeout_floor
+        self.timeout_ceiling = timeout_ceiling
+        self.timeout_multiplier = timeout_multiplier
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.faults = None
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        self._trial_in_flight = False
+        self.in_flight = 0
+        self.waiting = 0
+        self.counters = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'timeouts': 0,
+            'rejected_queue_full': 0,
+            'rejected_circuit_open': 0,
+            'circuit_opened': 0,
+        }
+
+    # -- timeout --------------------------------------------------------
+    def p95_latency(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def current_timeout(self):
+        """Timeout for the next call: multiplier x recent p95, clamped"""
+        p95 = self.p95_latency()
+        if p95 is None:
+            return self.timeout_ceiling
+        return min(self.timeout_ceiling, max(self.timeout_floor, p95 * self.timeout_multiplier))
+
+    # -- breaker --------------------------------------------------------
+    def _admit(self):
+        """Breaker check; returns True if this call is the half-open trial"""
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    self.counters['rejected_circuit_open'] += 1
+                    raise CircuitOpen(self.name, "circuit open", self._retry_after())
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN:
+                if self._trial_in_flight:
+                    self.counters['rejected_circuit_open'] += 1
+                    raise CircuitOpen(self.name, "circuit half-open, trial in flight", self._retry_after())
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def _retry_after(self):
+        remaining = self.reset_seconds - (time.monotonic() - self._opened_at)
+        return max(1, int(remaining + 0.5))
+
+    def _record(self, ok, elapsed, timed_out, trial):
+        with self._lock:
+            self.counters['calls'] += 1
+            if trial:
+                self._trial_in_flight = False
+            if ok:
+                self.counters['successes'] += 1
+                self._latencies.append(elapsed)
+                self._consecutive_failures = 0
+                self._state = CLOSED
+                return
+            self.counters['failures'] += 1
+            if timed_out:
+                self.counters['timeouts'] += 1
+            self._consecutive_failures += 1
+            if trial or (self._state == CLOSED and self._consecutive_failures >= self.failure_threshold):
+                if self._state != OPEN:
+                    self.counters['circuit_opened'] += 1
+                    print(f">>> Circuit for {self.name} opened after {self._consecutive_failures} failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    # -- slots ----------------------------------------------------------
+    def _acquire(self, wait=True):
+        if self._slots.acquire(blocking=False):
+            return
+        with self._lock:
+            if not wait:
+                self.counters['rejected_queue_full'] += 1
+                raise QueueFull(self.name, "no free slot")
+            if self.waiting >= self.max_queue:
+                self.counters['rejected_queue_full'] += 1
+                raise QueueFull(self.name, "too many queued calls")
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            with self._lock:
+                self.counters['rejected_queue_full'] += 1
+            raise QueueFull(self.name, f"no free slot within {self.queue_wait}s")
+
+    @contextmanager
+    def call(self, wait=True):
+        """
+        Guard one outbound call; yields a Call with .timeout and .failed().
+        wait=False fails with QueueFull instead of queueing for a slot
+        (background work that must not hold up interactive callers).
+        """
+        trial = self._admit()
+        try:
+            self._acquire(wait)
+        except Rejected:
+            if trial:
+                with self._lock:
+                    self._trial_in_flight = False
+            raise
+
+        with self._lock:
+            self.in_flight += 1
+        handle = Call(self.current_timeout())
+        start = time.monotonic()
+        try:
+            if self.faults:
+                self.faults.apply(handle.timeout)
+            yield handle
+        except BaseException as e:
+            self._record(False, time.monotonic() - start, _is_timeout(e), trial)
+            raise
+        else:
+            self._record(handle.ok, time.monotonic() - start, False, trial)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def reset(self):
+        """Close the breaker and forget latency history"""
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+            self._latencies.clear()
+
+    def has_capacity(self, reserved=0):
+        """Closed breaker and more than `reserved` free slots with nobody queued"""
+        with self._lock:
+            if self._state != CLOSED:
+                return False
+            return self.waiting == 0 and self.in_flight < self.max_concurrency - reserved
+
+    def state(self):
+        with self._lock:
+            state = self._state
+            if state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                state = HALF_OPEN
+            snapshot = {
+                'state': state,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'consecutive_failures': self._consecutive_failures,
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'counters': dict(self.counters),
+            }
+        p95 = self.p95_latency()
+        snapshot['p95_latency_s'] = round(p95, 3) if p95 is not None else None
+        snapshot['timeout_s'] = round(self.current_timeout(), 3)
+        snapshot['faults'] = self.faults.describe() if self.faults else None
+        return snapshot
+
+
+# =======================
+# Fault injection
+# =======================
+class FaultInjector:
+    """Adds latency and random failures at the start of every guarded call"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def apply(self, timeout):
+        delay = self.latency + self._random.uniform(0, self.jitter) if (self.latency or self.jitter) else 0
+        if delay:
+            time.sleep(min(delay, timeout))
+            if delay > timeout:
+                raise InjectedTimeout(f"injected latency {delay:.2f}s exceeded timeout {timeout:.2f}s")
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise InjectedFault("injected failure")
+
+    def describe(self):
+        return {'latency': self.latency, 'jitter': self.jitter, 'error_rate': self.error_rate}
+
+
+def parse_faults(spec):
+    """'gemini:latency=3,error_rate=0.5;naver:error_rate=1' -> {name: FaultInjector}"""
+    faults = {}
+    for entry in filter(None, (part.strip() for part in (spec or '').split(';'))):
+        name, _, options = entry.partition(':')
+        kwargs = {}
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            kwargs[key.strip()] = float(value)
+        faults[name.strip()] = FaultInjector(**kwargs)
+    return faults
+
+
+def stub(guard, result=None, latency=0.0, error_rate=0.0, seed=None):
+    """
+    Local stand-in for a dependency: a function that runs through the guard,
+    sleeps `latency` and fails with probability `error_rate`. For exercising
+    limits and the breaker without network access (see bench/outbound_guard.py).
+    """
+    rng = random.Random(seed)
+
+    def fake_call():
+        with guard.call() as call:
+            time.sleep(min(latency, call.timeout))
+            if latency > call.timeout:
+                raise InjectedTimeout(f"stub latency {latency:.2f}s exceeded timeout {call.timeout:.2f}s")
+            if rng.random() < error_rate:
+                raise InjectedFault("stub failure")
+            return result
+
+    return fake_call
+
+
+# =======================
+# Configured guards
+# =======================
+def _env(name, key, default, cast=float):
+    return cast(os.environ.get(f"OUTBOUND_{name.upper()}_{key}", default))
+
+
+def _build_guard(name, concurrency, queue, floor, ceiling, threshold=5, reset=30):
+    return Guard(
+        name,
+        max_concurrency=_env(name, 'CONCURRENCY', concurrency, int),
+        max_queue=_env(name, 'QUEUE', queue, int),
+        queue_wait=_env(name, 'QUEUE_WAIT', 2.0),
+        timeout_floor=_env(name, 'TIMEOUT_FLOOR', floor),
+        timeout_ceiling=_env(name, 'TIMEOUT_CEILING', ceiling),
+        failure_threshold=_env(name, 'FAILURE_THRESHOLD', threshold, int),
+        reset_seconds=_env(name, 'RESET_SECONDS', reset),
+    )
+
+
+guards = {
+    # Image generation is slow (seconds) and expensive; keep few in flight
+    'gemini': _build_guard('gemini', concurrency=2, queue=4, floor=15.0, ceiling=60.0),
+    # Naver shopping search and its image CDN (admin import only)
+    'naver': _build_guard('naver', concurrency=4, queue=8, floor=2.0, ceiling=10.0),
+    'translator': _build_guard('translator', concurrency=4, queue=8, floor=1.0, ceiling=5.0),
+}
+
+for _name, _injector in parse_faults(os.environ.get('OUTBOUND_FAULTS')).items():
+    if _name in guards:
+        guards[_name].faults = _injector
+
+
+def states():
+    return {name: guard.state() for name, guard in guards.items()}
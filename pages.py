@@ -0,0 +1,184 @@
+"""
+Single-round-trip page loaders.
+
+Each loader fetches everything one page needs with one statement: child
+rows (sizes, previews, pets) are aggregated with json_agg in correlated
+subqueries instead of separate queries, so a page costs one network round
+trip however far away the database is. Results are small NamedTuples
+(no image bytes); numbers in the JSON parts are decoded as Decimal so they
+compare and render exactly like plain column values.
+"""
+import json
+from decimal import Decimal
+from functools import partial
+from typing import NamedTuple, Optional
+
+from psycopg2.extras import register_default_json, register_default_jsonb
+
+import db
+
+
+_json_loads = partial(json.loads, parse_float=Decimal)
+
+
+def _plain_cursor(conn):
+    cur = conn.cursor()
+    register_default_json(cur, loads=_json_loads)
+    register_default_jsonb(cur, loads=_json_loads)
+    return cur
+
+
+# =======================
+# Product detail
+# =======================
+class ProductSize(NamedTuple):
+    id: int
+    label: str
+    chest_cm: Decimal
+    back_cm: Decimal
+    neck_cm: Optional[Decimal]
+    weight_min_kg: Optional[Decimal]
+    weight_max_kg: Optional[Decimal]
+    sku: Optional[str]
+    stock_qty: Optional[int]
+
+
+class PreviewProduct(NamedTuple):
+    id: int
+    name: str
+    brand: Optional[str]
+
+
+class ProductDetail(NamedTuple):
+    id: int
+    name: str
+    brand: Optional[str]
+    category: Optional[str]
+    description: Optional[str]
+    base_price_cents: int
+    weather_tag: Optional[str]
+    style_tag: Optional[str]
+    popularity_score: Optional[Decimal]
+    active: bool
+    sizes: tuple
+
+    @property
+    def price(self):
+        return self.base_price_cents / 100
+
+
+class ProductPage(NamedTuple):
+    product: Optional[ProductDetail]
+    preview_products: tuple
+
+
+PRODUCT_PAGE = db.statement('product_page', """
+    SELECT p.id, p.name, p.brand, p.category, p.description, p.base_price_cents,
+           p.weather_tag, p.style_tag, p.popularity_score, p.active,
+           COALESCE((
+               SELECT json_agg(json_build_array(
+                          s.id, s.label, s.chest_cm, s.back_cm, s.neck_cm,
+                          s.weight_min_kg, s.weight_max_kg, s.sku, s.stock_qty)
+                      ORDER BY CASE s.label
+                                   WHEN 'XXS' THEN 1
+                                   WHEN 'XS' THEN 2
+                                   WHEN 'S' THEN 3
+                                   WHEN 'M' THEN 4
+                                   WHEN 'L' THEN 5
+                                   WHEN 'XL' THEN 6
+                                   WHEN 'XXL' THEN 7
+                                   ELSE 8
+                               END)
+               FROM product_sizes s
+               WHERE s.product_id = p.id
+           ), '[]') AS sizes,
+           COALESCE((
+               SELECT json_agg(json_build_array(q.id, q.name, q.brand) ORDER BY q.ord)
+               FROM (
+                   SELECT o.id, o.name, o.brand,
+                          row_number() OVER (ORDER BY (o.category = p.category) DESC, o.created_at DESC) AS ord
+                   FROM products o
+                   WHERE o.active = TRUE AND o.id <> p.id
+                   ORDER BY (o.category = p.category) DESC, o.created_at DESC
+                   LIMIT 3
+               ) q
+           ), '[]') AS preview_products
+    FROM products p
+    WHERE p.id = %s
+""")
+
+
+def load_product_page(conn, product_id):
+    """Product, its sizes (XXS..XXL order) and 3 preview products, in one query"""
+    cur = _plain_cursor(conn)
+    try:
+        db.execute(cur, PRODUCT_PAGE, (product_id,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    if row is None:
+        return ProductPage(None, ())
+    *columns, sizes, previews = row
+    product = ProductDetail(*columns, sizes=tuple(ProductSize(*size) for size in sizes))
+    return ProductPage(product, tuple(PreviewProduct(*preview) for preview in previews))
+
+
+# =======================
+# User profile (My Page, pet pickers)
+# =======================
+class UserSummary(NamedTuple):
+    id: int
+    username: str
+    email: Optional[str]
+    created_at: object
+
+
+class Profile(NamedTuple):
+    user: Optional[UserSummary]
+    pets: tuple  # dicts, newest first, without image bytes
+    rev: Optional[int] = None  # users.profile_rev the rows were read at
+
+
+PROFILE = db.statement('profile', """
+    SELECT u.profile_rev, u.id, u.username, u.email, u.created_at,
+           COALESCE((
+               SELECT json_agg(row_to_json(x) ORDER BY x.created_at DESC)
+               FROM (
+                   SELECT id, user_id, name, breed_id, weight_kg, size_label,
+                          weather_preference, style_preference, neck_cm, chest_cm, back_cm,
+                          feature_vector, image_mime_type, image_data IS NOT NULL AS has_image, created_at
+                   FROM pets
+                   WHERE user_id = u.id
+               ) x
+           ), '[]') AS pets
+    FROM users u
+    WHERE u.id = %s
+""")
+
+
+def load_profile(conn, user_id):
+    """User summary and their pets (as dicts), in one query"""
+    cur = _plain_cursor(conn)
+    try:
+        db.execute(cur, PROFILE, (user_id,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    if row is None:
+        return Profile(None, ())
+    rev, *columns, pets = row
+    return Profile(UserSummary(*columns), tuple(pets), rev)
+
+
+PROFILE_REV = db.statement('profile_rev', "SELECT profile_rev FROM users WHERE id = %s")
+
+
+def load_profile_rev(conn, user_id):
+    """users.profile_rev (bumped by triggers on any pet or account change), or None"""
+    cur = _plain_cursor(conn)
+    try:
+        db.execute(cur, PROFILE_REV, (user_id,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    return row[0] if row else None
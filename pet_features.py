@@ -0,0 +1,215 @@
+"""
+Persisted pet feature vectors.
+
+The recommenders score a pet by its estimated chest/back/neck (breed
+averages scaled by its weight), its weight and its weather/style
+preferences. These are precomputed into pets.feature_vector (FEATURES
+order, DOUBLE PRECISION[]) so scorers read one column: no breeds lookup,
+no Decimal arithmetic per request.
+
+Keeping it current:
+  - add_pet / update_pet call refresh_pets() for the pet in the same
+    transaction as the write
+  - triggers (db/migrate_pet_features.sql) reset the vector to NULL when a
+    pet's inputs change by any other path, and for every pet of a breed
+    whose averages change
+  - refresh_stale() recomputes NULL vectors in batches; the background
+    scheduler runs it, `flask pet-features` backfills (--all recomputes all)
+
+Readers (pet_context) estimate from the given breed row only while a
+pet's vector is still NULL.
+"""
+import os
+
+from psycopg2.extras import execute_values
+
+
+PET_FEATURES_BATCH_SIZE = int(os.environ.get('PET_FEATURES_BATCH_SIZE', '1000'))
+
+FEATURES = ('chest_cm', 'back_cm', 'neck_cm', 'weight_kg', 'weather', 'style')
+
+# Preference vocabularies: the code is the index. NULL (and '') encode as 0,
+# the "no preference" entry the scorers default to for them.
+WEATHER_PREFERENCES = ('all-season', 'cold', 'warm', 'rain')
+STYLE_PREFERENCES = ('any', 'classic', 'sport', 'street')
+
+# Any other stored value (not from the forms) encodes as UNKNOWN_CODE and
+# decodes to UNKNOWN_PREFERENCE, which matches no product tag: it scores like
+# the raw value did against every tag in the vocabularies (a mismatch)
+UNKNOWN_CODE = -1
+UNKNOWN_PREFERENCE = '(unknown)'
+
+# Dimensions for pets without a (measured) breed
+DEFAULT_DIMENSIONS = {'chest_cm': 40, 'back_cm': 32, 'neck_cm': 28}
+
+
+# =======================
+# Computing and decoding
+# =======================
+def estimate_dimensions(breed, weight_kg):
+    """
+    Estimate chest/back/neck from breed averages and weight.
+
+    Formula:
+    - If weight provided: estimated_size = avg_breed_size * (dog_weight / avg_breed_weight)
+    - If no weight: use average breed size
+    """
+    if not breed or not breed.get('avg_chest_cm'):
+        return dict(DEFAULT_DIMENSIONS)
+
+    avg_chest = float(breed['avg_chest_cm'] or 40)
+    avg_back = float(breed['avg_back_cm'] or 32)
+    avg_neck = float(breed['avg_neck_cm'] or 28)
+    avg_weight = float(breed['avg_weight_kg'] or 5)
+
+    if weight_kg:
+        weight_ratio = float(weight_kg) / avg_weight
+        return {
+            'chest_cm': avg_chest * weight_ratio,
+            'back_cm': avg_back * weight_ratio,
+            'neck_cm': avg_neck * weight_ratio,
+        }
+    return {'chest_cm': avg_chest, 'back_cm': avg_back, 'neck_cm': avg_neck}
+
+
+def encode_preference(value, vocabulary):
+    if not value:
+        return 0
+    return vocabulary.index(value) if value in vocabulary else UNKNOWN_CODE
+
+
+def decode_preference(code, vocabulary):
+    code = int(code)
+    return UNKNOWN_PREFERENCE if code == UNKNOWN_CODE else vocabulary[code]
+
+
+def feature_vector(pet, breed):
+    """pets.feature_vector for a pet row (breed_id, weight_kg, preferences) and its breed row"""
+    dimensions = estimate_dimensions(breed, pet.get('weight_kg'))
+    weight = pet.get('weight_kg')
+    return [
+        float(dimensions['chest_cm']),
+        float(dimensions['back_cm']),
+        float(dimensions['neck_cm']),
+        float(weight) if weight is not None else None,
+        float(encode_preference(pet.get('weather_preference'), WEATHER_PREFERENCES)),
+        float(encode_preference(pet.get('style_preference'), STYLE_PREFERENCES)),
+    ]
+
+
+def decode(vector):
+    """
+    Scorer inputs from a stored vector: {'dimensions', 'weight_kg',
+    'weather_pref', 'style_pref'}. Elements may be Decimal (vectors read
+    through pages' JSON).
+    """
+    chest, back, neck, weight, weather, style = vector
+    return {
+        'dimensions': {'chest_cm': float(chest), 'back_cm': float(back), 'neck_cm': float(neck)},
+        'weight_kg': float(weight) if weight is not None else None,
+        'weather_pref': decode_preference(weather, WEATHER_PREFERENCES),
+        'style_pref': decode_preference(style, STYLE_PREFERENCES),
+    }
+
+
+def pet_context(pet, breed_lookup):
+    """
+    Scorer inputs for a pet row: its stored vector, or (not yet computed)
+    one estimated now from breed_lookup(breed_id).
+    """
+    vector = pet.get('feature_vector')
+    if vector is None:
+        vector = feature_vector(pet, breed_lookup(pet.get('breed_id')))
+    return decode(vector)
+
+
+# =======================
+# Maintenance
+# =======================
+PET_INPUTS_SQL = """
+    SELECT id, breed_id, weight_kg, weather_preference, style_preference
+    FROM pets
+    WHERE {where}
+    ORDER BY id
+    LIMIT %(limit)s
+    FOR UPDATE {wait}
+"""
+
+
+def _write_vectors(cur, pets):
+    """Compute and store vectors for locked pet rows (tuples from PET_INPUTS_SQL)"""
+    if not pets:
+        return 0
+    # Read after the rows are locked: a breed change that touched these pets has committed
+    breed_ids = list({pet[1] for pet in pets if pet[1] is not None})
+    breeds = {}
+    if breed_ids:
+        cur.execute("""
+            SELECT id, avg_weight_kg, avg_chest_cm, avg_back_cm, avg_neck_cm
+            FROM breeds WHERE id = ANY(%s)
+        """, (breed_ids,))
+        for breed_id, avg_weight, avg_chest, avg_back, avg_neck in cur.fetchall():
+            breeds[breed_id] = {'avg_weight_kg': avg_weight, 'avg_chest_cm': avg_chest,
+                                'avg_back_cm': avg_back, 'avg_neck_cm': avg_neck}
+    rows = []
+    for pet_id, breed_id, weight_kg, weather_pref, style_pref in pets:
+        pet = {'weight_kg': weight_kg, 'weather_preference': weather_pref, 'style_preference': style_pref}
+        rows.append((pet_id, feature_vector(pet, breeds.get(breed_id))))
+    execute_values(cur, """
+        UPDATE pets p
+        SET feature_vector = v.vector
+        FROM (VALUES %s) AS v(id, vector)
+        WHERE p.id = v.id
+    """, rows, template="(%s::bigint, %s::float8[])", page_size=len(rows))
+    return len(rows)
+
+
+def refresh_pets(conn, pet_ids):
+    """Recompute the vectors of the given pets in the caller's transaction (no commit); returns how many"""
+    cur = conn.cursor()
+    try:
+        cur.execute(PET_INPUTS_SQL.format(where="id = ANY(%(ids)s)", wait=""),
+                    {'ids': list(pet_ids), 'limit': len(pet_ids)})
+        return _write_vectors(cur, cur.fetchall())
+    finally:
+        cur.close()
+
+
+def refresh_stale(conn, batch_size=PET_FEATURES_BATCH_SIZE):
+    """
+    Compute every NULL vector, one committed batch at a time. Rows locked by
+    a concurrent writer are skipped (that writer sets or resets them).
+    Returns how many were written.
+    """
+    cur = conn.cursor()
+    written = 0
+    try:
+        while True:
+            cur.execute(PET_INPUTS_SQL.format(where="feature_vector IS NULL", wait="SKIP LOCKED"),
+                        {'limit': batch_size})
+            pets = cur.fetchall()
+            written += _write_vectors(cur, pets)
+            conn.commit()
+            if len(pets) < batch_size:
+                return written
+    finally:
+        cur.close()
+
+
+def refresh_all(conn, batch_size=PET_FEATURES_BATCH_SIZE):
+    """Recompute every pet's vector (e.g. after changing the encoding); returns how many"""
+    cur = conn.cursor()
+    written = 0
+    after = 0
+    try:
+        while True:
+            cur.execute(PET_INPUTS_SQL.format(where="id > %(after)s", wait=""),
+                        {'after': after, 'limit': batch_size})
+            pets = cur.fetchall()
+            written += _write_vectors(cur, pets)
+            conn.commit()
+            if len(pets) < batch_size:
+                return written
+            after = pets[-1][0]
+    finally:
+        cur.close()
@@ -56,6 +56,10 @@ source venv/bin/activate
 echo "📦 Installing dependencies..."
 pip install -q -r requirements.txt
 
+# Fingerprint and precompress static assets (served from /assets/)
+echo "🎨 Building static assets..."
+flask --app app build-assets > /dev/null
+
 # Check database connection
 echo "🔍 Checking database connection..."
 python3 << EOF
@@ -77,10 +81,15 @@ fi
 
 echo ""
 echo "🚀 Starting Flask application..."
-echo "   Access the app at: http://localhost:5000"
+echo "   Access the app at: http://localhost:${PORT:-5000}"
 echo ""
 echo "   Press Ctrl+C to stop"
 echo ""
 
-# Run the Flask app
-python3 app.py
+# Run the Flask app: debug server only when FLASK_DEBUG=1, otherwise the
+# pre-fork gunicorn server (see gunicorn.conf.py)
+if [ "$FLASK_DEBUG" = "1" ]; then
+    python3 app.py
+else
+    exec gunicorn -c gunicorn.conf.py app:app
+fi
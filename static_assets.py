@@ -0,0 +1,169 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`flask build-assets` copies each file under static/ (except uploads/ and
+the output directory) to static/dist/ with a content hash in its name
+(style.css -> style.3f2a9c0d81b7.css), writes .gz and, when the Brotli
+package is installed, .br variants of text assets, and records the mapping
+in static/dist/manifest.json.
+
+Templates link assets with asset_url('style.css'); the /assets/ route
+serves the best precompressed variant the client accepts with
+`Cache-Control: immutable`, so browsers never revalidate them: a changed
+file gets a new name. Without a build (e.g. in development) asset_url()
+falls back to the plain /static/ URL.
+"""
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+STATIC_DIR = 'static'
+ASSET_DIST_DIR = os.environ.get('ASSET_DIST_DIR', os.path.join(STATIC_DIR, 'dist'))
+ASSET_MANIFEST = 'manifest.json'
+ASSET_URL_PREFIX = '/assets/'
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Never fingerprinted: user uploads, and the build output itself
+SKIP_DIRS = {'uploads', os.path.basename(ASSET_DIST_DIR)}
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml', '.ico'}
+MIN_COMPRESS_BYTES = 256
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# =======================
+# Build
+# =======================
+def fingerprint(name, data):
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+
+
+def _write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(prefix='.asset_', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _source_files(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        relative_root = os.path.relpath(root, static_dir)
+        if relative_root == '.':
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        dirs.sort()
+        for name in sorted(files):
+            if not name.startswith('.'):
+                yield os.path.normpath(os.path.join(relative_root, name)).replace(os.sep, '/')
+
+
+def build(static_dir=STATIC_DIR, dist_dir=ASSET_DIST_DIR, prune=False):
+    """
+    Fingerprint and precompress every static asset; returns a summary.
+    Outputs of earlier builds are kept (pages rendered before a deploy may
+    still reference them) unless prune is set.
+    """
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+    written = set()
+    summary = {'files': 0, 'bytes': 0, 'gzip_bytes': 0, 'brotli_bytes': 0, 'brotli': brotli is not None}
+
+    for name in _source_files(static_dir):
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            data = f.read()
+        target = fingerprint(name, data)
+        manifest[name] = target
+        target_path = os.path.join(dist_dir, target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if not os.path.exists(target_path):
+            _write_atomic(target_path, data)
+        written.add(target)
+        summary['files'] += 1
+        summary['bytes'] += len(data)
+
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS or len(data) < MIN_COMPRESS_BYTES:
+            continue
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0), 'gzip_bytes')]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11), 'brotli_bytes'))
+        for suffix, compressed, counter in variants:
+            # Only worth serving when it is actually smaller
+            if len(compressed) >= len(data):
+                continue
+            if not os.path.exists(target_path + suffix):
+                _write_atomic(target_path + suffix, compressed)
+            written.add(target + suffix)
+            summary[counter] += len(compressed)
+
+    _write_atomic(os.path.join(dist_dir, ASSET_MANIFEST),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    written.add(ASSET_MANIFEST)
+
+    summary['pruned'] = 0
+    if prune:
+        for root, _, files in os.walk(dist_dir):
+            for name in files:
+                relative = os.path.relpath(os.path.join(root, name), dist_dir).replace(os.sep, '/')
+                if relative not in written:
+                    os.remove(os.path.join(root, name))
+                    summary['pruned'] += 1
+    summary['manifest'] = manifest
+    return summary
+
+
+# =======================
+# Lookup and serving
+# =======================
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def load_manifest(dist_dir=ASSET_DIST_DIR):
+    """Source name -> fingerprinted name, read once per process ({} without a build)"""
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                try:
+                    with open(os.path.join(dist_dir, ASSET_MANIFEST)) as f:
+                        _manifest = json.load(f)
+                except (OSError, ValueError):
+                    _manifest = {}
+    return _manifest
+
+
+def reset_manifest():
+    """Re-read the manifest on next use (after a build in a running process)"""
+    global _manifest
+    _manifest = None
+
+
+def fingerprinted_name(name):
+    return load_manifest().get(name)
+
+
+def pick_encoding(accepted, target, dist_dir=ASSET_DIST_DIR):
+    """
+    (file name, Content-Encoding or None) of the best variant of target
+    that exists and the client accepts; accepted(coding) returns a quality.
+    """
+    for coding, suffix in ENCODINGS:
+        if accepted(coding) > 0 and os.path.isfile(os.path.join(dist_dir, target + suffix)):
+            return target + suffix, coding
+    return target, None
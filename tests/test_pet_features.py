@@ -0,0 +1,46 @@
+"""Preferences decoded from stored feature vectors must score like the raw pet columns did"""
+import pytest
+
+import app
+import pet_features
+
+
+WEATHER_TAGS = pet_features.WEATHER_PREFERENCES + (None, '')
+STYLE_TAGS = pet_features.STYLE_PREFERENCES[1:] + (None, '')
+
+
+def raw_weather(value):
+    """What the scorers got before feature vectors: the column, defaulted when empty"""
+    return value or 'all-season'
+
+
+def raw_style(value):
+    return value or 'any'
+
+
+def decoded(weather, style):
+    pet = {'weight_kg': 5, 'weather_preference': weather, 'style_preference': style}
+    return pet_features.decode(pet_features.feature_vector(pet, None))
+
+
+@pytest.mark.parametrize('weather', pet_features.WEATHER_PREFERENCES + (None, '', 'snow', 'hot'))
+def test_weather_preference_scores_like_raw_value(weather):
+    context = decoded(weather, None)
+    for tag in WEATHER_TAGS:
+        assert app.calculate_weather_score(context['weather_pref'], tag) == \
+            app.calculate_weather_score(raw_weather(weather), tag), tag
+
+
+@pytest.mark.parametrize('style', pet_features.STYLE_PREFERENCES + (None, '', 'formal', 'cute'))
+def test_style_preference_scores_like_raw_value(style):
+    context = decoded(None, style)
+    for tag in STYLE_TAGS:
+        assert app.calculate_style_score(context['style_pref'], tag) == \
+            app.calculate_style_score(raw_style(style), tag), tag
+
+
+def test_unknown_preference_round_trips_as_unknown():
+    vector = pet_features.feature_vector({'weather_preference': 'snow', 'style_preference': 'formal'}, None)
+    assert vector[4:] == [pet_features.UNKNOWN_CODE, pet_features.UNKNOWN_CODE]
+    context = pet_features.decode(vector)
+    assert context['weather_pref'] == context['style_pref'] == pet_features.UNKNOWN_PREFERENCE
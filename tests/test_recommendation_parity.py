@@ -0,0 +1,193 @@
+"""
+rank_with_index() and rank_with_sql() must return exactly what
+rank_with_python() returns.
+
+All engines run on the same synthetic catalog. For the index engine,
+rank_with_python() reads it through a stand-in for the server-side cursor
+and rank_with_index() from a CatalogSnapshot built in memory, so no
+Postgres is needed. The SQL engine needs Postgres: the catalog is loaded
+into temporary products/product_sizes tables (which shadow the real ones
+for that connection only) and both engines query those; these tests are
+skipped when DATABASE_URL is not set.
+"""
+import os
+import random
+
+import psycopg2
+import pytest
+from psycopg2.extras import RealDictCursor, execute_values
+
+import app
+import catalog
+import pet_features
+
+
+CATEGORIES = ('coat', 'sweater', 'raincoat', 'harness', 'pajamas', 'tshirt', None)
+WEATHER_TAGS = ('all-season', 'cold', 'warm', 'rain', None)
+STYLE_TAGS = ('classic', 'sport', 'street', None)
+SIZE_LABELS = ('L', 'M', 'S', 'XL', 'XS')
+
+
+def make_catalog(seed, products=300):
+    """
+    Rows shaped like rank_with_python()'s catalog query, in its (product id,
+    size label) order, and the size label of each row
+    """
+    rng = random.Random(seed)
+    rows = []
+    labels = []
+    size_id = 0
+    for product_id in range(1, products + 1):
+        category = rng.choice(CATEGORIES)
+        price_cents = rng.choice((900, 2500, 4999, 10000, 18000))
+        weather_tag = rng.choice(WEATHER_TAGS)
+        style_tag = rng.choice(STYLE_TAGS)
+        popularity = round(rng.random(), 2)
+        for label in sorted(rng.sample(SIZE_LABELS, rng.randint(1, len(SIZE_LABELS)))):
+            size_id += 1
+            chest_cm = round(rng.uniform(20, 90), 1)
+            back_cm = round(rng.uniform(15, 70), 1)
+            neck_cm = round(rng.uniform(15, 50), 1) if rng.random() < 0.7 else None
+            if rng.random() < 0.6:
+                weight_min_kg = round(rng.uniform(1, 30), 1)
+                weight_max_kg = weight_min_kg + rng.choice((2, 5, 10))
+            else:
+                weight_min_kg = weight_max_kg = None
+            rows.append((product_id, category, price_cents, weather_tag, style_tag, popularity,
+                         size_id, chest_cm, back_cm, neck_cm, weight_min_kg, weight_max_kg))
+            labels.append(label)
+        if rng.random() < 0.05:
+            # Another size with the same features: ties are broken by catalog order
+            size_id += 1
+            rows.append(rows[-1][:6] + (size_id,) + rows[-1][7:])
+            labels.append(labels[-1] + '2')
+    return rows, labels
+
+
+class CatalogCursor:
+    """Server-side cursor stand-in: iterates over the catalog rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.itersize = None
+
+    def execute(self, query, params=None):
+        pass
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+
+class CatalogConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, name=None):
+        return CatalogCursor(self.rows)
+
+
+def make_snapshot(rows):
+    snapshot = catalog.CatalogSnapshot(version=1)
+    for row in rows:
+        snapshot.append(*row)
+    snapshot.build_index()
+    return snapshot
+
+
+def pet_contexts():
+    breeds = [
+        None,
+        {'avg_chest_cm': 35, 'avg_back_cm': 28, 'avg_neck_cm': 22, 'avg_weight_kg': 4},
+        {'avg_chest_cm': 70, 'avg_back_cm': 55, 'avg_neck_cm': 40, 'avg_weight_kg': 25},
+    ]
+    for breed in breeds:
+        for weight_kg in (None, 2.5, 8, 30):
+            for weather in pet_features.WEATHER_PREFERENCES:
+                for style in pet_features.STYLE_PREFERENCES:
+                    pet = {'weight_kg': weight_kg, 'weather_preference': weather, 'style_preference': style}
+                    yield pet_features.decode(pet_features.feature_vector(pet, breed))
+
+
+def winners(ranked):
+    return [(product_id, size_id, pytest.approx(score, abs=1e-9))
+            for score, _row_index, _scores, product_id, size_id in ranked]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+@pytest.mark.parametrize('top_n', [1, 3, 10])
+def test_index_matches_python(seed, top_n):
+    rows, _ = make_catalog(seed)
+    conn = CatalogConnection(rows)
+    snapshot = make_snapshot(rows)
+    for pet_context in pet_contexts():
+        expected = app.rank_with_python(conn, 1, pet_context, top_n)
+        assert winners(app.rank_with_index(snapshot, pet_context, top_n)) == winners(expected), pet_context
+
+
+def test_index_matches_python_on_empty_catalog():
+    snapshot = make_snapshot([])
+    pet_context = next(pet_contexts())
+    assert app.rank_with_index(snapshot, pet_context, 3) == app.rank_with_python(CatalogConnection([]), 1,
+                                                                                  pet_context, 3)
+
+
+# =======================
+# SQL engine (Postgres)
+# =======================
+@pytest.fixture(params=[1, 2])
+def catalog_db(request):
+    """Connection whose products/product_sizes are a synthetic catalog in temp tables, rolled back afterwards"""
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        pytest.skip('DATABASE_URL is not set')
+    rows, labels = make_catalog(request.param)
+    conn = psycopg2.connect(url)
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TEMP TABLE products (
+                id                BIGINT PRIMARY KEY,
+                category          TEXT,
+                base_price_cents  INTEGER NOT NULL,
+                weather_tag       TEXT,
+                style_tag         TEXT,
+                popularity_score  NUMERIC(4,2),
+                active            BOOLEAN NOT NULL DEFAULT TRUE
+            ) ON COMMIT DROP;
+            CREATE TEMP TABLE product_sizes (
+                id             BIGINT PRIMARY KEY,
+                product_id     BIGINT NOT NULL,
+                label          TEXT NOT NULL,
+                chest_cm       NUMERIC(6,2) NOT NULL,
+                back_cm        NUMERIC(6,2) NOT NULL,
+                neck_cm        NUMERIC(6,2),
+                weight_min_kg  NUMERIC(6,2),
+                weight_max_kg  NUMERIC(6,2)
+            ) ON COMMIT DROP;
+        """)
+        products = {row[0]: row[:6] for row in rows}
+        execute_values(cur, "INSERT INTO products (id, category, base_price_cents, weather_tag, style_tag, "
+                            "popularity_score) VALUES %s", list(products.values()))
+        execute_values(cur, "INSERT INTO product_sizes (id, product_id, label, chest_cm, back_cm, neck_cm, "
+                            "weight_min_kg, weight_max_kg) VALUES %s",
+                       [(row[6], row[0], label) + row[7:] for row, label in zip(rows, labels)])
+        # An inactive product is left out by both engines
+        cur.execute("INSERT INTO products (id, category, base_price_cents, active) VALUES (0, 'coat', 100, FALSE)")
+        cur.execute("INSERT INTO product_sizes (id, product_id, label, chest_cm, back_cm) VALUES (0, 0, 'M', 40, 32)")
+        cur.close()
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+@pytest.mark.parametrize('top_n', [1, 3, 10])
+def test_sql_matches_python(catalog_db, top_n):
+    cur = catalog_db.cursor(cursor_factory=RealDictCursor)
+    for pet_context in pet_contexts():
+        expected = app.rank_with_python(catalog_db, 1, pet_context, top_n)
+        assert winners(app.rank_with_sql(cur, pet_context, top_n)) == winners(expected), pet_context
+    cur.close()
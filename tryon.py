@@ -0,0 +1,418 @@
+"""
+AI try-on renders (Gemini image model), interactive and speculative.
+
+render() makes one guarded Gemini call for a pet photo, a product image
+and the scene settings (background / weather / tone). Results are stored
+in the asset store under cache_key(), so a render is reused for the same
+pet photo, product photo and settings. Product photos come from the
+database (load_product_image()) on both paths.
+
+Speculative pre-generation
+--------------------------
+Users very often try on one of the top recommendations right after seeing
+them. SpeculativeQueue renders those with the default settings
+(DEFAULT_SETTINGS) in the background, so the click finds a cached result.
+The work is strictly lower priority than interactive try-ons:
+
+  - one worker thread per process, never waiting in the Gemini guard's
+    queue; TRYON_SPECULATIVE_RESERVED_SLOTS guard slots are left free for
+    interactive calls
+  - jobs are dropped (not retried) when the breaker is not closed, when
+    there is no spare capacity, or when they waited longer than
+    TRYON_SPECULATIVE_MAX_AGE_SECONDS; a full queue drops its oldest job
+  - each user gets TRYON_SPECULATIVE_USER_BUDGET renders per
+    TRYON_SPECULATIVE_USER_WINDOW_SECONDS, and a token bucket caps all
+    speculative renders at TRYON_SPECULATIVE_RATE_PER_MINUTE
+  - a click on a render in progress waits at most TRYON_CLICK_WAIT_SECONDS
+    for it, then renders itself
+
+Like the outbound guards, queue, budgets and rate are per process.
+"""
+import os
+import time
+import base64
+import hashlib
+import threading
+from collections import deque, OrderedDict
+
+import images
+import integrations
+import outbound
+
+
+TRYON_SPECULATIVE_ENABLED = os.environ.get('TRYON_SPECULATIVE_ENABLED', '1') == '1'
+TRYON_SPECULATIVE_QUEUE = int(os.environ.get('TRYON_SPECULATIVE_QUEUE', '32'))
+TRYON_SPECULATIVE_USER_BUDGET = int(os.environ.get('TRYON_SPECULATIVE_USER_BUDGET', '6'))
+TRYON_SPECULATIVE_USER_WINDOW_SECONDS = float(os.environ.get('TRYON_SPECULATIVE_USER_WINDOW_SECONDS', '3600'))
+TRYON_SPECULATIVE_RATE_PER_MINUTE = float(os.environ.get('TRYON_SPECULATIVE_RATE_PER_MINUTE', '6'))
+TRYON_SPECULATIVE_BURST = int(os.environ.get('TRYON_SPECULATIVE_BURST', '3'))
+TRYON_SPECULATIVE_MAX_AGE_SECONDS = float(os.environ.get('TRYON_SPECULATIVE_MAX_AGE_SECONDS', '120'))
+TRYON_SPECULATIVE_RESERVED_SLOTS = int(os.environ.get('TRYON_SPECULATIVE_RESERVED_SLOTS', '1'))
+# How long a click waits for a speculative render of the same try-on that is
+# already in progress before rendering it itself
+TRYON_CLICK_WAIT_SECONDS = float(os.environ.get('TRYON_CLICK_WAIT_SECONDS', '3'))
+
+# What the try-on buttons send when the user didn't pick anything
+DEFAULT_SETTINGS = ('studio', 'clear', 'neutral')
+
+BACKGROUNDS = {
+    "original": "the original pet photo background and lighting",
+    "studio": "a clean studio backdrop with soft lighting",
+    "park": "a sunny park with greenery in the background",
+    "snowy": "a snowy outdoor scene with soft winter light",
+    "rainy": "a cozy rainy-day outdoor scene with muted tones"
+}
+WEATHERS = {
+    "clear": "clear skies and crisp daylight",
+    "cloudy": "soft overcast light",
+    "drizzle": "light rain with gentle reflections",
+    "snowfall": "falling snow with soft winter light"
+}
+TONES = {
+    "neutral": "natural, true-to-life colors",
+    "warm": "warm, golden color grading",
+    "cool": "cool, clean color grading",
+    "vivid": "vibrant, punchy colors"
+}
+
+
+# =======================
+# Rendering
+# =======================
+def build_prompt(background, weather, tone):
+    background_hint = BACKGROUNDS.get(background, BACKGROUNDS["studio"])
+    weather_hint = WEATHERS.get(weather, WEATHERS["clear"])
+    tone_hint = TONES.get(tone, TONES["neutral"])
+    if background == "original":
+        weather_hint = "match the original lighting conditions"
+        tone_hint = "preserve the original colors and tone"
+    elif background == "studio":
+        weather_hint = "soft, even studio lighting"
+    return (
+        f"Create a realistic photograph of this dog wearing the clothing item shown, "
+        f"set in {background_hint}. {weather_hint}. {tone_hint}. "
+        "Natural pose, high quality, detailed texture."
+    )
+
+
+def cache_key(model, pet_id, pet_image_data, product_id, product_image_hash, background, weather, tone):
+    """generated_assets.cache_key of a render; a new pet or product photo gets new keys"""
+    pet_image_hash = hashlib.sha256(pet_image_data).hexdigest()
+    raw = (f"tryon:v2:{model}:{pet_id}:{pet_image_hash}:{product_id}:{product_image_hash}:"
+           f"{background}:{weather}:{tone}")
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+PRODUCT_IMAGE_SQL = "SELECT image_data FROM products WHERE id = %s"
+
+
+def load_product_image(conn, product_id):
+    """
+    A product's stored photo and its SHA-256 (for cache_key), or None
+    without one. Both the interactive and the speculative path render from
+    this, normalized with product_image_for_render(), so equal keys mean
+    equal inputs.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(PRODUCT_IMAGE_SQL, (product_id,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    if not row or not row[0]:
+        return None
+    data = bytes(row[0])
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def product_image_for_render(data):
+    """The JPEG sent to Gemini for a stored product photo"""
+    return images.normalize_image_bytes(data)[0]
+
+
+def render(client, model, pet_image_data, pet_mime_type, product_image_data, background, weather, tone,
+           wait=True):
+    """
+    One guarded Gemini call; (image bytes, content type), or None when the
+    model returned no image. Raises outbound.Rejected when the guard
+    refuses (wait=False: also when no slot is free right now).
+    """
+    types = integrations.genai_types()
+    contents = [
+        build_prompt(background, weather, tone),
+        types.Part.from_bytes(data=pet_image_data, mime_type=pet_mime_type or 'image/jpeg'),
+        types.Part.from_bytes(data=product_image_data, mime_type="image/jpeg")
+    ]
+
+    with outbound.guards['gemini'].call(wait=wait) as call:
+        response = client.models.generate_content(
+            model=model,
+            contents=contents,
+            config=types.GenerateContentConfig(
+                response_modalities=["IMAGE"],
+                http_options=types.HttpOptions(timeout=int(call.timeout * 1000))
+            )
+        )
+
+    parts = getattr(response, 'parts', None)
+    if not parts and response.candidates:
+        parts = response.candidates[0].content.parts
+
+    for part in parts or ():
+        if part.inline_data:
+            image_bytes = part.inline_data.data
+            if isinstance(image_bytes, str):
+                image_bytes = base64.b64decode(image_bytes)
+            return image_bytes, part.inline_data.mime_type or 'image/jpeg'
+    return None
+
+
+# =======================
+# Speculative pre-generation
+# =======================
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` saved up"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self):
+        """Seconds to wait before a token is available; 0.0 means one was taken"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            if self.rate <= 0:
+                return float('inf')
+            return (1 - self._tokens) / self.rate
+
+    def give_back(self):
+        """Return a token that was taken but not used"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class SpeculativeJob:
+    def __init__(self, user_id, pet_id, product_id):
+        self.user_id = user_id
+        self.pet_id = pet_id
+        self.product_id = product_id
+        self.queued_at = time.monotonic()
+
+    @property
+    def key(self):
+        return (self.pet_id, self.product_id)
+
+
+PET_IMAGE_SQL = "SELECT image_data, image_mime_type FROM pets WHERE id = %s AND user_id = %s"
+
+
+class SpeculativeQueue:
+    """Low-priority background renders of the default try-on for recommended products"""
+
+    def __init__(self, get_conn, assets, model, max_queue=TRYON_SPECULATIVE_QUEUE,
+                 user_budget=TRYON_SPECULATIVE_USER_BUDGET, user_window=TRYON_SPECULATIVE_USER_WINDOW_SECONDS,
+                 rate_per_minute=TRYON_SPECULATIVE_RATE_PER_MINUTE, burst=TRYON_SPECULATIVE_BURST,
+                 max_age=TRYON_SPECULATIVE_MAX_AGE_SECONDS, reserved_slots=TRYON_SPECULATIVE_RESERVED_SLOTS,
+                 enabled=TRYON_SPECULATIVE_ENABLED):
+        self.get_conn = get_conn
+        self.assets = assets
+        self.model = model
+        self.max_queue = max_queue
+        self.user_budget = user_budget
+        self.user_window = user_window
+        self.max_age = max_age
+        self.reserved_slots = reserved_slots
+        self.enabled = enabled
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+
+        self._jobs = OrderedDict()   # (pet_id, product_id) -> SpeculativeJob, oldest first
+        self._running = {}           # (pet_id, product_id) -> Event set when the render finished
+        self._spent = {}             # user_id -> deque of render start times
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = None
+        self._worker_pid = None
+        self.counters = {
+            'queued': 0,
+            'rendered': 0,
+            'already_cached': 0,
+            'failed': 0,
+            'dropped_queue_full': 0,
+            'dropped_stale': 0,
+            'dropped_load': 0,
+            'dropped_cancelled': 0,
+            'skipped_user_budget': 0,
+            'skipped_no_image': 0,
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    # -- submitting -----------------------------------------------------
+    def _budget_left(self, user_id, now):
+        spent = self._spent.get(user_id)
+        while spent and now - spent[0] >= self.user_window:
+            spent.popleft()
+        if spent is not None and not spent:
+            del self._spent[user_id]
+        pending = sum(1 for job in self._jobs.values() if job.user_id == user_id)
+        return self.user_budget - len(spent or ()) - pending
+
+    def submit(self, user_id, pet_id, product_ids):
+        """Queue default try-ons of product_ids for a user's pet; returns how many were queued"""
+        if not self.enabled or self.max_queue <= 0 or not integrations.gemini_key_configured():
+            return 0
+        queued = 0
+        with self._lock:
+            now = time.monotonic()
+            for product_id in product_ids:
+                job = SpeculativeJob(user_id, pet_id, product_id)
+                if job.key in self._jobs or job.key in self._running:
+                    continue
+                if self._budget_left(user_id, now) <= 0:
+                    self.counters['skipped_user_budget'] += 1
+                    continue
+                if len(self._jobs) >= self.max_queue:
+                    self._jobs.popitem(last=False)
+                    self.counters['dropped_queue_full'] += 1
+                self._jobs[job.key] = job
+                self.counters['queued'] += 1
+                queued += 1
+            if queued:
+                self._ensure_worker()
+                self._wakeup.notify()
+        return queued
+
+    def cancel(self, pet_id, product_id):
+        """Forget a queued job (the user is rendering it themselves); True if one was queued"""
+        with self._lock:
+            if self._jobs.pop((pet_id, product_id), None) is None:
+                return False
+            self.counters['dropped_cancelled'] += 1
+            return True
+
+    def wait_for(self, pet_id, product_id, timeout):
+        """Wait for a render of this pet and product that is in progress; False if none was (or it timed out)"""
+        with self._lock:
+            done = self._running.get((pet_id, product_id))
+        return done is not None and done.wait(timeout)
+
+    # -- worker ---------------------------------------------------------
+    def _ensure_worker(self):
+        """Start the worker thread in this process (caller holds the lock)"""
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        if self._worker_pid != pid:
+            # Forked: the parent's running renders don't exist here
+            self._running.clear()
+        self._worker = threading.Thread(target=self._work, name='speculative-tryons', daemon=True)
+        self._worker_pid = pid
+        self._worker.start()
+
+    def _next_job(self):
+        """
+        Newest queued job that is still fresh, once the rate cap allows a
+        render (blocks until then). Jobs stay queued, and cancellable,
+        while waiting for a token.
+        """
+        while True:
+            with self._lock:
+                while not self._jobs:
+                    self._wakeup.wait()
+            delay = self.bucket.take()
+            if delay:
+                time.sleep(min(delay, self.max_age))
+                continue
+            with self._lock:
+                while self._jobs:
+                    _, job = self._jobs.popitem(last=True)
+                    if time.monotonic() - job.queued_at > self.max_age:
+                        self.counters['dropped_stale'] += 1
+                        continue
+                    self._running[job.key] = threading.Event()
+                    return job
+            self.bucket.give_back()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            try:
+                if not self._run(job):
+                    self.bucket.give_back()
+            except Exception as e:
+                self._count('failed')
+                print(f">>> Speculative try-on failed for pet {job.pet_id}, product {job.product_id}: {e}")
+            finally:
+                with self._lock:
+                    self._running.pop(job.key).set()
+
+    def _run(self, job):
+        """Render one job; False when Gemini was not called (its rate token is given back)"""
+        conn = self.get_conn()
+        cur = conn.cursor()
+        try:
+            cur.execute(PET_IMAGE_SQL, (job.pet_id, job.user_id))
+            pet = cur.fetchone()
+            product = load_product_image(conn, job.product_id)
+        finally:
+            cur.close()
+            conn.close()
+        if not pet or not pet[0] or not product:
+            self._count('skipped_no_image')
+            return False
+
+        pet_image_data, pet_mime_type = bytes(pet[0]), pet[1]
+        product_image_data, product_image_hash = product
+        key = cache_key(self.model, job.pet_id, pet_image_data, job.product_id, product_image_hash,
+                        *DEFAULT_SETTINGS)
+        if self.assets.find(key):
+            self._count('already_cached')
+            return False
+
+        client = integrations.get_gemini_client()
+        if client is None or not outbound.guards['gemini'].has_capacity(self.reserved_slots):
+            self._count('dropped_load')
+            return False
+
+        with self._lock:
+            self._spent.setdefault(job.user_id, deque()).append(time.monotonic())
+        try:
+            result = render(client, self.model, pet_image_data, pet_mime_type,
+                            product_image_for_render(product_image_data), *DEFAULT_SETTINGS, wait=False)
+        except outbound.Rejected:
+            # Interactive calls took the slots (or the breaker opened) meanwhile; nothing was spent
+            with self._lock:
+                self._spent[job.user_id].pop()
+            self._count('dropped_load')
+            return False
+        if result is None:
+            self._count('failed')
+            return True
+        image_bytes, content_type = result
+        self.assets.put(image_bytes, content_type=content_type, owner_user_id=job.user_id,
+                        product_id=job.product_id, pet_id=job.pet_id, cache_key=key)
+        self._count('rendered')
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'queued': len(self._jobs),
+                'running': len(self._running),
+                'max_queue': self.max_queue,
+                'users_with_budget_spent': len(self._spent),
+                'counters': dict(self.counters),
+            }